@@ -0,0 +1,165 @@
+import heapq
+import threading
+import time
+
+from sqlalchemy import event
+
+from app import app, db
+from matching import MatchEngine, SCORED_PREFERENCES, pet_match_row, preference_key
+from jobs import task
+from models import MatchProfile, Pet
+
+
+def save_match_profile(user, preferences):
+    """Create or update the user's saved match profile (not committed)"""
+    profile = MatchProfile.query.filter_by(user_id=user.id).first()
+    if profile is None:
+        profile = MatchProfile(user_id=user.id)
+        db.session.add(profile)
+    for field in MatchProfile.PREFERENCE_FIELDS:
+        setattr(profile, field, preferences.get(field))
+    profile.active = True
+    return profile
+
+
+class ApplicantIndex:
+    """
+    In-memory index of active match profiles for reverse matching
+    (which applicants suit a given pet). Profiles are partitioned by
+    species, the one preference that zeroes a score, and within a
+    species grouped by their scored preferences. The form only offers
+    a few thousand distinct combinations, so a pet is scored once per
+    combination however many applicants there are.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._groups = {}  # species -> {preference key: (preferences, set of user ids)}
+        self._keys = {}  # user id -> (species, preference key)
+
+    def load(self):
+        """Rebuild the index from the database with a column-only query"""
+        columns = [MatchProfile.user_id] + [getattr(MatchProfile, field) for field in SCORED_PREFERENCES]
+        rows = db.session.execute(db.select(*columns).where(MatchProfile.active.is_(True))).all()
+        groups = {}
+        for row in rows:
+            groups.setdefault(row[1:], []).append(row[0])
+        with self._lock:
+            self._groups = {}
+            self._keys = {}
+            for values, user_ids in groups.items():
+                preferences = dict(zip(SCORED_PREFERENCES, values))
+                key = preference_key(preferences, None)
+                species_groups = self._groups.setdefault(preferences['species'], {})
+                species_groups.setdefault(key, (preferences, set()))[1].update(user_ids)
+                self._keys.update(dict.fromkeys(user_ids, (preferences['species'], key)))
+            self._loaded_at = time.monotonic()
+        app.logger.info(f'Applicant index loaded {len(rows)} match profiles')
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def _add(self, user_id, preferences):
+        key = preference_key(preferences, None)
+        species_groups = self._groups.setdefault(preferences['species'], {})
+        species_groups.setdefault(key, (preferences, set()))[1].add(user_id)
+        self._keys[user_id] = (preferences['species'], key)
+
+    def _remove(self, user_id):
+        species, key = self._keys.pop(user_id, (None, None))
+        if species is None:
+            return
+        species_groups = self._groups[species]
+        species_groups[key][1].discard(user_id)
+        if not species_groups[key][1]:
+            del species_groups[key]
+
+    def apply(self, user_id, preferences):
+        """Add, refresh or (with preferences=None) drop one applicant"""
+        with self._lock:
+            if self._loaded_at is None:
+                return  # The next load picks the change up
+            self._remove(user_id)
+            if preferences is not None:
+                self._add(user_id, preferences)
+
+    def top_applicants(self, pet, limit, min_score=50, exclude=()):
+        """
+        Best-matching applicants for a pet as [(user_id, score), ...],
+        highest score first and then by user id, plus the number of
+        applicants at or above min_score.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            groups = list(self._groups.get(pet.species, {}).values())
+            if not groups:
+                return [], 0
+            _, scores = MatchEngine.from_rows([pet_match_row(pet)]).score_many(
+                [preferences for preferences, _ in groups])
+            levels = {}
+            for (_, user_ids), score in zip(groups, scores[:, 0]):
+                if score >= min_score:
+                    levels.setdefault(int(score), []).append(user_ids)
+
+            total = sum(len(user_ids) - len(user_ids.intersection(exclude))
+                        for level in levels.values() for user_ids in level)
+            # Only the best score levels are read, taking as many ids as are still needed
+            applicants = []
+            for score in sorted(levels, reverse=True):
+                needed = limit - len(applicants)
+                if needed <= 0:
+                    break
+                candidates = (user_id for user_ids in levels[score] for user_id in user_ids
+                              if user_id not in exclude)
+                applicants.extend((user_id, score) for user_id in heapq.nsmallest(needed, candidates))
+        return applicants, total
+
+
+applicant_index = ApplicantIndex(max_age=app.config.get('MATCH_SNAPSHOT_MAX_AGE', 300))
+
+
+@task('notify_matching_applicants')
+def notify_matching_applicants(pet_id):
+    """Tell the best-matching applicants about a newly listed pet"""
+    pet = db.session.get(Pet, pet_id)
+    if pet is None or pet.adoption_status != 'available':
+        return []
+    applicants, total = applicant_index.top_applicants(
+        pet, app.config.get('APPLICANT_NOTIFY_LIMIT', 20), exclude={pet.user_id})
+    if applicants:
+        app.logger.info(f'Pet {pet.id} matches {total} applicants; notifying users '
+                        f"{', '.join(str(user_id) for user_id, _ in applicants)}")
+    return applicants
+
+
+# Keep the index in sync with committed profile changes
+@event.listens_for(db.session, 'after_flush')
+def _collect_profile_changes(session, flush_context):
+    pending = session.info.setdefault('applicant_index_pending', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, MatchProfile):
+            pending[obj.user_id] = obj.preferences() if obj.active else None
+    for obj in session.deleted:
+        if isinstance(obj, MatchProfile):
+            pending[obj.user_id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_profile_changes(session):
+    pending = session.info.pop('applicant_index_pending', None)
+    if not pending:
+        return
+    for user_id, preferences in pending.items():
+        applicant_index.apply(user_id, preferences)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_profile_changes(session):
+    session.info.pop('applicant_index_pending', None)
@@ -0,0 +1,41 @@
+"""Shared setup for the benchmark scripts."""
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Benchmarks never touch the development database
+DEFAULT_DATABASE = os.path.join(ROOT, 'instance', 'benchmark.db')
+RESULTS_FOLDER = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def use_database(database):
+    """
+    Point the app at the benchmark database (a SQLite path or a database
+    URL) and make the app importable. Must run before `import app`.
+    """
+    if '://' not in database:
+        database = f'sqlite:///{os.path.abspath(database)}'
+    os.environ['DATABASE_URL'] = database
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return database
+
+
+def git_revision():
+    """Short commit hash of the checkout (with -dirty for local changes), or None"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                  text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{revision}-dirty' if dirty else revision
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
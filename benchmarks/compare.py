@@ -0,0 +1,59 @@
+"""
+Compare two load test results saved by load.py.
+
+    python benchmarks/compare.py benchmarks/results/BEFORE.json benchmarks/results/AFTER.json
+
+Prints throughput and latency percentiles per route with the relative
+change; for latency negative is better, for throughput positive is.
+"""
+import argparse
+import json
+
+
+METRICS = ('throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'sql_per_request')
+
+
+def change(before, after):
+    if before is None or after is None:
+        return ''
+    if before == 0:
+        return '' if after == 0 else 'new'
+    return f'{(after - before) * 100 / before:+.0f}%'
+
+
+def describe(results):
+    label = f" ({results['label']})" if results.get('label') else ''
+    return (f"{results.get('revision') or 'unknown'}{label}: {results['workers']} workers, "
+            f"{results['duration']:.0f}s, {results['dataset']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before, after = json.load(before_file), json.load(after_file)
+    print(f'before {describe(before)}')
+    print(f'after  {describe(after)}')
+
+    header = f'{"route":<32}' + ''.join(f'{metric:>24}' for metric in METRICS)
+    print(header)
+    rows = sorted(set(before['routes']) | set(after['routes']))
+    for route in rows + ['TOTAL']:
+        old = before['total'] if route == 'TOTAL' else before['routes'].get(route, {})
+        new = after['total'] if route == 'TOTAL' else after['routes'].get(route, {})
+        cells = []
+        for metric in METRICS:
+            old_value, new_value = old.get(metric), new.get(metric)
+            if old_value is None and new_value is None:
+                cells.append(f'{"-":>24}')
+                continue
+            shown = f"{'-' if old_value is None else f'{old_value:g}'} -> {'-' if new_value is None else f'{new_value:g}'}"
+            cells.append(f'{shown + " " + change(old_value, new_value):>24}')
+        print(f'{route:<32}' + ''.join(cells))
+
+
+if __name__ == '__main__':
+    main()
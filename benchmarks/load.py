@@ -0,0 +1,270 @@
+"""
+Load test of the main user journeys, run against the real app in process.
+
+Worker threads, each with its own test client and signed-in user, pick
+journeys by weight and run them until the time is up:
+
+  browse   home page, pet listing (all and one species), pet detail,
+           product listing, product detail
+  search   pet listing with a search query, with and without a species filter
+  match    pet match form, match results page, match API
+  cart     add products to the cart, cart, checkout page, place the order
+  donate   donation page, make a donation
+
+Reports throughput, p50/p95/p99 latency and SQL statements per request
+for every route, and saves the results as JSON (benchmarks/results by
+default) so runs on different commits can be compared with compare.py.
+Seed the database first with seed.py.
+
+    python benchmarks/load.py --workers 8 --duration 60
+    python benchmarks/load.py --journeys browse=1,search=1 --label search-only
+
+CSRF checks are turned off for the run (the forms are posted directly),
+and sign-ins happen before the clock starts.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from common import DEFAULT_DATABASE, RESULTS_FOLDER, git_revision, percentile, use_database
+
+
+DEFAULT_JOURNEYS = 'browse=40,search=20,match=15,cart=15,donate=10'
+SEARCH_TERMS = ['friendly', 'retriever', 'play', 'calm', 'gentle lab', 'siamese', 'loves walks', 'kit', 'bea']
+# Statements per request, from the Server-Timing header metrics.py adds
+_SQL_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+MATCH_FORM_CHOICES = {
+    'species': ['dog', 'cat', 'rabbit', 'bird'],
+    'age_preference': ['baby', 'adult', 'senior', 'any'],
+    'gender_preference': ['male', 'female', 'any'],
+    'size_preference': ['small', 'medium', 'large', 'any'],
+    'energy_level': ['low', 'medium', 'high', 'any'],
+    'good_with_children': ['yes', 'no'],
+    'good_with_other_pets': ['yes', 'no'],
+    'special_needs': ['yes', 'no'],
+    'living_environment': ['apartment', 'house_small', 'house_large', 'rural'],
+    'time_availability': ['minimal', 'moderate', 'extensive'],
+    'training_preference': ['already_trained', 'willing_to_train', 'professional_help'],
+}
+
+
+class Dataset:
+    """Ids and values the journeys pick from, read once from the seeded database"""
+
+    def __init__(self, app, db):
+        from models import Pet, Product, User
+
+        with app.app_context():
+            self.pet_ids = [pet_id for pet_id, in db.session.query(Pet.id).filter(Pet.adoption_status == 'available')]
+            self.product_ids = [product_id for product_id, in db.session.query(Product.id)]
+            self.usernames = [name for name, in db.session.query(User.username).filter(User.username.like('user%'))]
+        if not self.pet_ids or not self.product_ids or not self.usernames:
+            sys.exit('The benchmark database is empty; run benchmarks/seed.py first')
+
+    def counts(self):
+        return {'available_pets': len(self.pet_ids), 'products': len(self.product_ids), 'users': len(self.usernames)}
+
+
+class Worker(threading.Thread):
+    """One simulated user running journeys in a loop"""
+
+    def __init__(self, number, app, dataset, journeys, rng, record):
+        super().__init__(name=f'load-worker-{number}', daemon=True)
+        self.client = app.test_client()
+        self.dataset = dataset
+        self.journeys = journeys
+        self.rng = rng
+        self.record = record
+        self.deadline = None
+        self.email = f'{rng.choice(dataset.usernames)}@example.com'
+
+    def sign_in(self):
+        response = self.client.post('/login', data={'email': self.email, 'password': 'benchmark'})
+        if response.status_code != 302:
+            raise RuntimeError(f'Sign-in as {self.email} failed with status {response.status_code}')
+
+    def request(self, route, method, url, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        sql = _SQL_COUNT.search(response.headers.get('Server-Timing', ''))
+        self.record(route, started, elapsed, response.status_code in expected, int(sql.group(1)) if sql else None)
+        return response
+
+    def browse(self):
+        rng, data = self.rng, self.dataset
+        self.request('GET index', 'GET', '/')
+        self.request('GET pet_listing', 'GET', '/pets')
+        self.request('GET pet_listing species', 'GET', f"/pets?species={rng.choice(['dog', 'cat'])}")
+        self.request('GET pet_detail', 'GET', f'/pets/{rng.choice(data.pet_ids)}')
+        self.request('GET products', 'GET', '/products')
+        self.request('GET product_detail', 'GET', f'/products/{rng.choice(data.product_ids)}')
+
+    def search(self):
+        term = self.rng.choice(SEARCH_TERMS)
+        self.request('GET pet_listing query', 'GET', '/pets', query_string={'query': term})
+        self.request('GET pet_listing query species', 'GET', '/pets',
+                     query_string={'query': term, 'species': self.rng.choice(['dog', 'cat'])})
+
+    def match(self):
+        form = {field: self.rng.choice(choices) for field, choices in MATCH_FORM_CHOICES.items()}
+        self.request('POST pet_match', 'POST', '/pet-match', data=form, expected=(302,))
+        self.request('GET pet_match_results', 'GET', '/pet-match-results')
+        preferences = dict(form, **{field: form[field] == 'yes'
+                                    for field in ('good_with_children', 'good_with_other_pets', 'special_needs')})
+        self.request('POST api_pet_match', 'POST', '/api/pet-match', json=preferences)
+
+    def cart(self):
+        for product_id in self.rng.sample(self.dataset.product_ids, self.rng.randint(1, 3)):
+            self.request('POST add_to_cart', 'POST', f'/cart/add/{product_id}',
+                         data={'quantity': self.rng.randint(1, 2)}, expected=(302,))
+        self.request('GET view_cart', 'GET', '/cart')
+        self.request('GET checkout', 'GET', '/checkout')
+        self.request('POST checkout', 'POST', '/checkout', expected=(302,))
+
+    def donate(self):
+        self.request('GET donate', 'GET', '/donate')
+        self.request('POST donate', 'POST', '/donate', expected=(302,),
+                     data={'amount': self.rng.choice([5, 10, 25]), 'message': 'Load test donation'})
+
+    def run(self):
+        names, weights = zip(*self.journeys.items())
+        while time.perf_counter() < self.deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+
+def parse_journeys(spec):
+    journeys = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if not hasattr(Worker, name) or name in ('run', 'request', 'sign_in'):
+            raise argparse.ArgumentTypeError(f'Unknown journey: {name}')
+        journeys[name] = float(weight or 1)
+    return journeys
+
+
+def summarize(samples, measured_seconds):
+    """Per-route and overall statistics from (route, elapsed, ok, sql) samples"""
+    routes = {}
+    for route, elapsed, ok, sql in samples:
+        entry = routes.setdefault(route, {'latencies': [], 'errors': 0, 'sql': []})
+        entry['latencies'].append(elapsed * 1000)
+        entry['errors'] += not ok
+        if sql is not None:
+            entry['sql'].append(sql)
+
+    def stats(latencies, errors, sql):
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': round(len(latencies) / measured_seconds, 2),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'p50_ms': round(percentile(latencies, 0.50), 3),
+            'p95_ms': round(percentile(latencies, 0.95), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'sql_per_request': round(statistics.fmean(sql), 2) if sql else None,
+        }
+
+    summary = {route: stats(**entry) for route, entry in sorted(routes.items())}
+    total = stats([latency for entry in routes.values() for latency in entry['latencies']],
+                  sum(entry['errors'] for entry in routes.values()),
+                  [count for entry in routes.values() for count in entry['sql']])
+    return summary, total
+
+
+def print_table(routes, total):
+    print(f'{"route":<32}{"requests":>9}{"errors":>7}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"SQL":>6}')
+    for route, stats in list(routes.items()) + [('TOTAL', total)]:
+        sql = '' if stats['sql_per_request'] is None else f"{stats['sql_per_request']:.1f}"
+        print(f"{route:<32}{stats['requests']:>9}{stats['errors']:>7}{stats['throughput']:>9.1f}"
+              f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{sql:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='SQLite path or database URL (seeded)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds measured')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds run first and not measured')
+    parser.add_argument('--journeys', type=parse_journeys, default=parse_journeys(DEFAULT_JOURNEYS),
+                        help=f'Journeys and their weights (default: {DEFAULT_JOURNEYS})')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed for the journeys')
+    parser.add_argument('--label', default='', help='Name stored with the results')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<time>-<commit>.json)')
+    args = parser.parse_args()
+
+    use_database(args.database)
+    # Per-request SQL counts come from the Server-Timing header
+    os.environ['METRICS_ENABLED'] = '1'
+    os.environ['SERVER_TIMING'] = '1'
+    from sqlalchemy.engine import make_url
+
+    from app import app, db
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    dataset = Dataset(app, db)
+    samples = []
+    samples_lock = threading.Lock()
+    measure_from = None
+
+    def record(route, started, elapsed, ok, sql):
+        if measure_from is not None and started >= measure_from:
+            with samples_lock:
+                samples.append((route, elapsed, ok, sql))
+
+    rng = random.Random(args.seed)
+    workers = [Worker(number, app, dataset, args.journeys, random.Random(rng.random()), record)
+               for number in range(args.workers)]
+    for worker in workers:
+        worker.sign_in()
+
+    started = time.perf_counter()
+    measure_from = started + args.warmup
+    for worker in workers:
+        worker.deadline = measure_from + args.duration
+        worker.start()
+    for worker in workers:
+        worker.join()
+    # Journeys in flight at the deadline finish past it
+    measured_seconds = time.perf_counter() - measure_from
+    if not samples:
+        sys.exit('No requests were measured; increase --duration')
+
+    routes, total = summarize(samples, measured_seconds)
+    print(f'{args.workers} workers, {measured_seconds:.1f}s measured after {args.warmup:g}s warm-up')
+    print_table(routes, total)
+
+    revision = git_revision()
+    results = {
+        'label': args.label,
+        'revision': revision,
+        'time': datetime.utcnow().isoformat(),
+        'database': make_url(app.config['SQLALCHEMY_DATABASE_URI']).render_as_string(hide_password=True),
+        'dataset': dataset.counts(),
+        'workers': args.workers,
+        'duration': round(measured_seconds, 3),
+        'warmup': args.warmup,
+        'journeys': args.journeys,
+        'seed': args.seed,
+        'routes': routes,
+        'total': total,
+    }
+    output = args.output or os.path.join(
+        RESULTS_FOLDER, f"{datetime.utcnow():%Y%m%d-%H%M%S}-{revision or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as results_file:
+        json.dump(results, results_file, indent=2)
+    print(f'Results saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Equivalence checks for the pet match scoring code, from the command line.
+
+Runs the checks in match_checks against the reference implementations
+in routes, with a random (printed) or given seed and as many cases as
+asked for:
+
+    python benchmarks/match_oracle.py
+    python benchmarks/match_oracle.py --cases 2000 --seed 7
+    python benchmarks/match_oracle.py --scorer mypackage.fast_match:score_many
+
+A candidate scorer is a callable taking (rows, profiles), where rows
+are match rows (matching.MATCH_COLUMNS) and profiles are preference
+dicts, and returning one sequence of scores per profile in row order.
+"""
+import argparse
+import importlib
+import random
+import sys
+import time
+
+from common import DEFAULT_DATABASE, use_database
+
+
+def load_scorer(spec):
+    """A built-in scorer by name, or module:callable"""
+    from match_checks import SCORERS
+
+    if spec in SCORERS:
+        return SCORERS[spec]
+    module, _, name = spec.partition(':')
+    if not name:
+        raise SystemExit(f'Unknown scorer {spec!r}; use one of {", ".join(SCORERS)} or module:callable')
+    return getattr(importlib.import_module(module), name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scorer', default='engine', help='Scorer to check: engine (default) or module:callable')
+    parser.add_argument('--cases', type=int, default=500, help='Random cases per check')
+    parser.add_argument('--pets', type=int, default=60, help='Largest random catalogue per case')
+    parser.add_argument('--seed', type=int, help='Random seed (default: random, printed for reruns)')
+    args = parser.parse_args()
+
+    # The checks never query the database, but importing the app connects to one
+    use_database(DEFAULT_DATABASE)
+    # The app module imports routes, matching and pet_import in a working order
+    import app  # noqa: F401
+    from match_checks import Mismatch, check_scores, check_ranking, check_derived
+
+    seed = args.seed if args.seed is not None else random.randrange(1 << 32)
+    rng = random.Random(seed)
+    scorer = load_scorer(args.scorer)
+    print(f'Seed {seed}')
+
+    checks = [('scores', lambda: check_scores(rng, scorer, args.cases, args.pets))]
+    if args.scorer == 'engine':
+        checks.append(('ranking', lambda: check_ranking(rng, args.cases, args.pets)))
+    checks.append(('derived', lambda: check_derived(rng, args.cases)))
+    for name, check in checks:
+        started = time.perf_counter()
+        try:
+            count = check()
+        except Mismatch as e:
+            print(f'{name}: FAILED\n{e}')
+            sys.exit(1)
+        print(f'{name}: {count} cases match the reference ({time.perf_counter() - started:.1f}s)')
+
+
+if __name__ == '__main__':
+    main()
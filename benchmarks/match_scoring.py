@@ -0,0 +1,186 @@
+"""
+Micro-benchmark of pet match scoring and matching attribute derivation.
+
+Scores generated catalogues (the same pet mix seed.py generates) against
+sets of preferences and reports pets scored per second for:
+
+  reference  routes.calculate_match_score, one pet at a time
+  engine     MatchEngine.score, one preference set per call
+  batch      MatchEngine.score_many, --batch preference sets per call
+  candidate  a scorer given with --scorer (see match_oracle.py), setup included
+
+for each catalogue size and preference mix:
+
+  any        species only, everything else "any" and no flags
+  specific   every preference set and every flag on
+  form       uniform over the choices of the pet match form
+
+It also reports pets per second through add_pet_matching_attributes and
+pet_import.MatchingAttributes. Run match_oracle.py to check that faster
+scorers still agree with the reference.
+
+    python benchmarks/match_scoring.py
+    python benchmarks/match_scoring.py --sizes 1000,100000 --mixes form --min-time 2
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from common import DEFAULT_DATABASE, git_revision, use_database
+
+
+MIXES = ('any', 'specific', 'form')
+
+
+def catalogue(rng, size):
+    """Match rows of `size` available pets, plus the (species, breed, age) they were derived from"""
+    from matching import MATCH_COLUMNS
+    from seed import generate_pets
+
+    rows, inputs = [], []
+    for pet_id, pet in enumerate(generate_pets(rng, size, [1], datetime.utcnow()), start=1):
+        pet.update(id=pet_id, adoption_status='available')
+        rows.append(tuple(pet[column] for column in MATCH_COLUMNS))
+        inputs.append((pet['species'], pet['breed'], pet['age']))
+    return rows, inputs
+
+
+def profiles(rng, mix, count):
+    from match_checks import FORM_PREFERENCES
+
+    result = []
+    for _ in range(count):
+        if mix == 'any':
+            profile = {field: 'any' for field in FORM_PREFERENCES}
+            profile.update(species=rng.choice(['dog', 'cat']), good_with_children=False,
+                           good_with_other_pets=False, special_needs=False)
+        elif mix == 'specific':
+            profile = {field: rng.choice([value for value in choices if value != 'any'])
+                       for field, choices in FORM_PREFERENCES.items()}
+            profile.update(species=rng.choice(['dog', 'cat']), good_with_children=True,
+                           good_with_other_pets=True, special_needs=True)
+        else:
+            profile = {field: rng.choice(choices) for field, choices in FORM_PREFERENCES.items()}
+        result.append(profile)
+    return result
+
+
+def throughput(run, items_per_call, min_time):
+    """Items per second, calling run(i) with i = 0, 1, 2, ... for at least min_time seconds"""
+    calls = 0
+    started = time.perf_counter()
+    while True:
+        run(calls)
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            return calls * items_per_call / elapsed
+
+
+def bench_scoring(rows, preference_sets, batch, min_time, candidate):
+    from match_checks import as_pet
+    from matching import MatchEngine
+    from routes import calculate_match_score
+
+    pets = [as_pet(row) for row in rows]
+    engine = MatchEngine.from_rows(rows)
+    count = len(preference_sets)
+
+    def reference(call):
+        preferences = preference_sets[call % count]
+        for pet in pets:
+            calculate_match_score(pet, preferences)
+
+    def batched(call):
+        engine.score_many([preference_sets[(call * batch + i) % count] for i in range(batch)])
+
+    results = {
+        'reference': throughput(reference, len(rows), min_time),
+        'engine': throughput(lambda call: engine.score(preference_sets[call % count]), len(rows), min_time),
+        'batch': throughput(batched, len(rows) * batch, min_time),
+    }
+    if candidate:
+        results['candidate'] = throughput(lambda call: candidate(rows, [preference_sets[call % count]]),
+                                          len(rows), min_time)
+    return results
+
+
+def bench_derived(inputs, min_time):
+    from match_checks import new_pet_defaults
+    from pet_import import MatchingAttributes
+    from routes import add_pet_matching_attributes
+
+    defaults = new_pet_defaults()
+
+    def reference(call):
+        for species, breed, age in inputs:
+            add_pet_matching_attributes(SimpleNamespace(species=species, breed=breed, age=age, **defaults))
+
+    def cached(call):
+        # A fresh cache per pass, as one import run would have
+        attributes = MatchingAttributes()
+        for species, breed, age in inputs:
+            attributes.derive(species, breed, age)
+
+    return {
+        'add_pet_matching_attributes': throughput(reference, len(inputs), min_time),
+        'MatchingAttributes': throughput(cached, len(inputs), min_time),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000,50000', help='Catalogue sizes, comma-separated')
+    parser.add_argument('--mixes', default=','.join(MIXES), help='Preference mixes, comma-separated')
+    parser.add_argument('--profiles', type=int, default=32, help='Preference sets per mix')
+    parser.add_argument('--batch', type=int, default=16, help='Preference sets per score_many call')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Seconds spent on each measurement')
+    parser.add_argument('--scorer', help='Also measure this scorer (module:callable, see match_oracle.py)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Also save the results as JSON to this file')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    mixes = [mix.strip() for mix in args.mixes.split(',')]
+    unknown = set(mixes) - set(MIXES)
+    if unknown:
+        parser.error(f'Unknown mix: {", ".join(sorted(unknown))}')
+
+    # Nothing here queries the database, but importing the app connects to one
+    use_database(DEFAULT_DATABASE)
+    import app  # noqa: F401
+    from match_oracle import load_scorer
+    candidate = load_scorer(args.scorer) if args.scorer else None
+
+    scorers = ['reference', 'engine', 'batch'] + (['candidate'] if candidate else [])
+    print(f'{"pets":>8}  {"mix":<10}' + ''.join(f'{name + " pets/s":>20}' for name in scorers)
+          + f'{"engine speedup":>16}')
+    results = {'revision': git_revision(), 'seed': args.seed, 'batch': args.batch, 'scoring': [], 'derived': []}
+    for size in sizes:
+        rows, inputs = catalogue(random.Random(args.seed), size)
+        for mix in mixes:
+            preference_sets = profiles(random.Random(args.seed), mix, args.profiles)
+            rates = bench_scoring(rows, preference_sets, args.batch, args.min_time, candidate)
+            print(f'{size:>8}  {mix:<10}' + ''.join(f'{rates[name]:>20,.0f}' for name in scorers)
+                  + f'{rates["engine"] / rates["reference"]:>15.1f}x')
+            results['scoring'].append(dict(pets=size, mix=mix, **rates))
+
+    print(f'\n{"pets":>8}{"add_pet_matching_attributes pets/s":>38}{"MatchingAttributes pets/s":>28}')
+    for size in sizes:
+        rates = bench_derived(catalogue(random.Random(args.seed), size)[1], args.min_time)
+        print(f'{size:>8}{rates["add_pet_matching_attributes"]:>38,.0f}{rates["MatchingAttributes"]:>28,.0f}')
+        results['derived'].append(dict(pets=size, **rates))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f'Results saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Seed a synthetic dataset for the load test.
+
+Creates the schema and the initialize_db sample data, then adds
+generated users, pets, products, orders and donations in bulk. Every
+generated user's password is "benchmark". Counts scale with --scale
+and each one can be given explicitly.
+
+    python benchmarks/seed.py                   # 1,000 users, 20,000 pets, ...
+    python benchmarks/seed.py --scale 10 --reset
+    python benchmarks/seed.py --pets 200000 --database /tmp/big.db
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from common import DEFAULT_DATABASE, use_database
+
+
+# Rows at --scale 1
+BASE_COUNTS = {'users': 1000, 'pets': 20000, 'products': 500, 'orders': 5000, 'donations': 5000}
+PASSWORD = 'benchmark'
+BATCH_SIZE = 5000
+
+SPECIES_BREEDS = {
+    'dog': ['Labrador Retriever', 'German Shepherd', 'Golden Retriever', 'Beagle', 'Bulldog', 'Poodle',
+            'Boxer', 'Chihuahua', 'Dachshund', 'Husky', 'Great Dane', 'Pomeranian', 'Border Collie', None],
+    'cat': ['Maine Coon', 'Siamese', 'Persian', 'Ragdoll', 'Bengal', 'Sphynx', 'Tabby', None],
+    'rabbit': ['Holland Lop', 'Netherland Dwarf', 'Lionhead', None],
+    'bird': ['Parakeet', 'Cockatiel', 'Canary', None],
+    'hamster': ['Syrian', 'Dwarf', None],
+    'fish': ['Goldfish', 'Betta', None],
+    'other': [None],
+}
+SPECIES_WEIGHTS = {'dog': 45, 'cat': 35, 'rabbit': 6, 'bird': 5, 'hamster': 3, 'fish': 2, 'other': 4}
+NAMES = ['Buddy', 'Max', 'Bella', 'Luna', 'Charlie', 'Lucy', 'Cooper', 'Daisy', 'Rocky', 'Milo', 'Oliver',
+         'Coco', 'Bear', 'Molly', 'Tucker', 'Sadie', 'Zeus', 'Nala', 'Pepper', 'Ginger', 'Shadow', 'Willow']
+WORDS = ['friendly', 'playful', 'calm', 'energetic', 'gentle', 'loyal', 'curious', 'shy', 'affectionate',
+         'smart', 'quiet', 'loves', 'walks', 'cuddles', 'children', 'toys', 'fetch', 'naps', 'garden', 'treats',
+         'house-trained', 'vaccinated', 'neutered', 'spayed', 'microchipped', 'senior', 'puppy', 'kitten']
+PRODUCT_CATEGORIES = ['Dog Food', 'Cat Food', 'Dog Accessories', 'Cat Accessories', 'Travel', 'Toys', 'Grooming']
+
+
+def scaled_counts(args):
+    return {name: getattr(args, name) if getattr(args, name) is not None else int(base * args.scale)
+            for name, base in BASE_COUNTS.items()}
+
+
+def insert_batches(table, rows):
+    """Insert rows from a generator with one executemany per batch"""
+    from app import db
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(table.insert(), batch)
+            batch.clear()
+    if batch:
+        db.session.execute(table.insert(), batch)
+    db.session.commit()
+
+
+def generate_users(rng, count, password_hash, now):
+    for number in range(1, count + 1):
+        yield {'username': f'user{number}', 'email': f'user{number}@example.com', 'password_hash': password_hash,
+               'first_name': rng.choice(NAMES), 'last_name': 'Benchmark', 'city': 'Testville', 'cart_count': 0,
+               'created_at': now - timedelta(days=rng.randint(0, 720))}
+
+
+def generate_pets(rng, count, user_ids, now):
+    from pet_import import DERIVED_FIELDS, MatchingAttributes
+
+    attributes = MatchingAttributes()
+    species_names = list(SPECIES_WEIGHTS)
+    weights = list(SPECIES_WEIGHTS.values())
+    for _ in range(count):
+        species = rng.choices(species_names, weights)[0]
+        breed = rng.choice(SPECIES_BREEDS[species])
+        age = rng.choice([None, rng.randint(1, 12), rng.randint(13, 84), rng.randint(85, 180)])
+        created_at = now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+        row = {
+            'name': rng.choice(NAMES), 'species': species, 'breed': breed, 'age': age,
+            'gender': rng.choice(['male', 'female']),
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(8, 30))),
+            'health_info': 'Vaccinated', 'behavior_info': ' '.join(rng.choices(WORDS, k=5)),
+            'adoption_status': rng.choices(['available', 'pending', 'adopted'], [85, 5, 10])[0],
+            'user_id': rng.choice(user_ids), 'created_at': created_at, 'updated_at': created_at,
+        }
+        row.update(zip(DERIVED_FIELDS, attributes.derive(species, breed, age)))
+        yield row
+
+
+def generate_products(rng, count, now):
+    for number in range(1, count + 1):
+        category = rng.choice(PRODUCT_CATEGORIES)
+        yield {'name': f'{category} #{number}', 'category': category, 'price': round(rng.uniform(3, 150), 2),
+               'description': ' '.join(rng.choices(WORDS, k=20)),
+               # Enough stock that checkouts in a load test never run out
+               'stock': 1_000_000, 'created_at': now, 'updated_at': now}
+
+
+def seed_orders(rng, count, user_ids, products, now):
+    from app import db
+    from models import Order, OrderItem
+
+    first_id = (db.session.query(db.func.max(Order.id)).scalar() or 0) + 1
+    orders, items = [], []
+    for order_id in range(first_id, first_id + count):
+        total = 0
+        for product_id, price in rng.sample(products, rng.randint(1, 4)):
+            quantity = rng.randint(1, 3)
+            items.append({'order_id': order_id, 'product_id': product_id, 'quantity': quantity, 'price': price})
+            total += price * quantity
+        orders.append({'id': order_id, 'user_id': rng.choice(user_ids), 'status': 'completed',
+                       'order_date': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365)),
+                       'total_amount': round(total, 2), 'shipping_address': '1 Benchmark Way'})
+    insert_batches(Order.__table__, iter(orders))
+    insert_batches(OrderItem.__table__, iter(items))
+
+
+def generate_donations(rng, count, user_ids, now):
+    for _ in range(count):
+        anonymous = rng.random() < 0.3
+        yield {'user_id': None if anonymous else rng.choice(user_ids), 'amount': rng.choice([5, 10, 25, 50, 100]),
+               'message': ' '.join(rng.choices(WORDS, k=6)) if rng.random() < 0.5 else None,
+               'is_anonymous': anonymous, 'donation_date': now - timedelta(minutes=rng.randint(0, 60 * 24 * 365))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default=DEFAULT_DATABASE, help='SQLite path or database URL')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier for every row count')
+    for name, base in BASE_COUNTS.items():
+        parser.add_argument(f'--{name}', type=int, help=f'Rows to generate ({base} x scale by default)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed, for reproducible datasets')
+    parser.add_argument('--reset', action='store_true', help='Delete an existing SQLite benchmark database first')
+    args = parser.parse_args()
+
+    if args.reset and '://' not in args.database:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.database + suffix):
+                os.remove(args.database + suffix)
+    use_database(args.database)
+    os.makedirs(os.path.dirname(os.path.abspath(args.database)), exist_ok=True)
+
+    from werkzeug.security import generate_password_hash
+    from sqlalchemy import text
+
+    from app import app, db
+    from models import Donation, Pet, Product, User
+    from routes import init_db, initialize_db
+
+    counts = scaled_counts(args)
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    with app.app_context():
+        init_db()
+        if db.session.query(User.id).filter(User.username == 'user1').first():
+            sys.exit('The database already has benchmark data; pass --reset (SQLite) or use an empty database')
+        initialize_db()
+
+        # Hashing is deliberately slow, so every user shares one hash
+        insert_batches(User.__table__, generate_users(rng, counts['users'], generate_password_hash(PASSWORD), now))
+        user_ids = [user_id for user_id, in db.session.query(User.id)]
+        insert_batches(Pet.__table__, generate_pets(rng, counts['pets'], user_ids, now))
+        insert_batches(Product.__table__, generate_products(rng, counts['products'], now))
+        products = db.session.query(Product.id, Product.price).all()
+        seed_orders(rng, counts['orders'], user_ids, [tuple(product) for product in products], now)
+        insert_batches(Donation.__table__, generate_donations(rng, counts['donations'], user_ids, now))
+
+        if db.engine.dialect.name in ('sqlite', 'postgresql'):
+            # Fresh statistics for the query planner
+            db.session.execute(text('ANALYZE'))
+            db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {', '.join(f'{count} {name}' for name, count in counts.items())} "
+          f'into {args.database} in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Worker cold-start benchmark.
+
+Starts fresh Python processes the way a gunicorn worker boots: import the
+app module, then serve the first request. Reports how long each phase
+takes over several runs.
+
+    python benchmarks/startup.py --runs 20
+    python benchmarks/startup.py --path /path/to/older/checkout
+
+The database must already exist (`flask init-db` and `flask seed-db`), or
+pass --prepare to run both once before measuring.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import percentile
+
+
+# Run in each child process; prints one JSON line of timings in milliseconds and
+# the number of SQL statements each phase ran
+CHILD = '''
+import json, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: statements.append(1))
+started = time.perf_counter()
+import {module} as module
+imported = time.perf_counter()
+import_statements = len(statements)
+response = module.app.test_client().get({url!r})
+served = time.perf_counter()
+print(json.dumps({{"import": (imported - started) * 1000, "first_request": (served - imported) * 1000,
+                  "total": (served - started) * 1000, "status": response.status_code,
+                  "import_sql": import_statements, "first_request_sql": len(statements) - import_statements}}))
+'''
+
+
+def run_once(path, module, url):
+    env = dict(os.environ, PYTHONPATH=path, JOB_WORKERS=os.environ.get('JOB_WORKERS', '0'))
+    result = subprocess.run([sys.executable, '-c', CHILD.format(module=module, url=url)], cwd=path, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise SystemExit(f'Child process failed:\n{result.stderr[-2000:]}')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def prepare(path):
+    env = dict(os.environ, PYTHONPATH=path)
+    # The app the flask command finds in the checkout: importing main would check the schema first
+    for command in ('init-db', 'seed-db'):
+        subprocess.run([sys.executable, '-m', 'flask', command], cwd=path, env=env,
+                       capture_output=True, text=True, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        help='Checkout to measure (default: this one)')
+    parser.add_argument('--module', default='main', help='Module exposing `app` (default: main)')
+    parser.add_argument('--url', default='/', help='First request to serve (default: /)')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--prepare', action='store_true', help='Run flask init-db and seed-db first')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.path)
+    if args.prepare:
+        prepare(path)
+    # One discarded run warms the OS file cache and writes bytecode
+    run_once(path, args.module, args.url)
+    runs = [run_once(path, args.module, args.url) for _ in range(args.runs)]
+
+    statuses = {run['status'] for run in runs}
+    print(f'{path} ({args.runs} runs, GET {args.url} -> {", ".join(map(str, sorted(statuses)))})')
+    print(f'{"phase":<15}{"median ms":>12}{"p90 ms":>10}{"min ms":>10}{"SQL":>6}')
+    for phase in ('import', 'first_request', 'total'):
+        values = [run[phase] for run in runs]
+        if phase == 'total':
+            sql = runs[-1]['import_sql'] + runs[-1]['first_request_sql']
+        else:
+            sql = runs[-1][f'{phase}_sql']
+        print(f'{phase:<15}{statistics.median(values):>12.1f}{percentile(values, 0.9):>10.1f}'
+              f'{min(values):>10.1f}{sql:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+from collections import namedtuple
+
+from sqlalchemy import case, func, insert, select, update
+from sqlalchemy.orm import joinedload
+
+from app import app, db
+from jobs import task, enqueue
+from models import User, Product, Order, OrderItem, CartItem
+
+
+# Flat shipping charge for any non-empty cart
+SHIPPING_COST = 5.99
+# Products at or below this stock are reported after an order
+LOW_STOCK_THRESHOLD = 5
+
+# Totals for a user's cart; `items` is only filled in by load_cart()
+CartSummary = namedtuple('CartSummary', ['items', 'subtotal', 'count', 'lines', 'shipping', 'total'])
+
+
+class InsufficientStock(Exception):
+    """Raised by place_order when some products can't cover the quantities ordered"""
+
+    def __init__(self, product_names):
+        super().__init__(f"Insufficient stock for: {', '.join(product_names)}")
+        self.product_names = product_names
+
+
+def _summary(items, subtotal, count, lines):
+    shipping = SHIPPING_COST if subtotal > 0 else 0
+    return CartSummary(items, subtotal, count, lines, shipping, subtotal + shipping)
+
+
+def load_cart(user_id):
+    """Load the user's cart items with their products in one query, plus the cart totals"""
+    items = (CartItem.query
+             .options(joinedload(CartItem.product))
+             .filter_by(user_id=user_id)
+             .order_by(CartItem.id)
+             .all())
+    subtotal = sum(item.product.price * item.quantity for item in items)
+    count = sum(item.quantity for item in items)
+    return _summary(items, subtotal, count, len(items))
+
+
+def cart_totals(user_id):
+    """Cart totals from a single aggregate query, without loading the items"""
+    subtotal, count, lines = db.session.execute(
+        select(func.coalesce(func.sum(Product.price * CartItem.quantity), 0),
+               func.coalesce(func.sum(CartItem.quantity), 0),
+               func.count(CartItem.id))
+        .select_from(CartItem)
+        .join(Product, Product.id == CartItem.product_id)
+        .where(CartItem.user_id == user_id)
+    ).one()
+    return _summary([], subtotal, count, lines)
+
+
+def cart_count_subquery(user_id):
+    return (select(func.coalesce(func.sum(CartItem.quantity), 0))
+            .where(CartItem.user_id == user_id)
+            .scalar_subquery())
+
+
+def get_cart_count(user):
+    """Number of items in the user's cart, served from the cached counter on the User row"""
+    if user.cart_count is not None:
+        return user.cart_count
+    return db.session.execute(select(cart_count_subquery(user.id))).scalar()
+
+
+def refresh_cart_count(user_id):
+    """
+    Recompute the user's cached cart count inside the current transaction.
+    Call after changing the user's cart items and before committing, so the
+    counter and the cart are committed together.
+    """
+    db.session.flush()
+    db.session.execute(update(User)
+                       .where(User.id == user_id)
+                       .values(cart_count=cart_count_subquery(user_id))
+                       .execution_options(synchronize_session=False))
+
+
+def place_order(user, cart):
+    """
+    Turn a loaded cart (see load_cart) into an order in a single transaction.
+
+    Stock for every product is reserved with one conditional UPDATE
+    (stock = stock - q WHERE stock >= q), so concurrent checkouts can never
+    drive stock negative and only the purchased product rows are locked.
+    If any product is short, nothing is written and InsufficientStock is
+    raised. Order items are written with a single bulk insert.
+    """
+    quantities = {}
+    for item in cart.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    ordered = case(quantities, value=Product.id)
+
+    result = db.session.execute(update(Product)
+                                .where(Product.id.in_(quantities), Product.stock >= ordered)
+                                .values(stock=Product.stock - ordered)
+                                .execution_options(synchronize_session=False))
+    if result.rowcount != len(quantities):
+        db.session.rollback()
+        short = db.session.execute(select(Product.name)
+                                   .where(Product.id.in_(quantities), Product.stock < ordered)
+                                   .order_by(Product.name)).scalars().all()
+        raise InsufficientStock(short)
+
+    order = Order(
+        user_id=user.id,
+        total_amount=cart.total,
+        shipping_address=f"{user.address}, {user.city}, {user.state} {user.zip_code}"
+    )
+    db.session.add(order)
+    db.session.flush()  # Flush to get the order ID
+
+    db.session.execute(insert(OrderItem), [
+        {
+            'order_id': order.id,
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'price': item.product.price
+        }
+        for item in cart.items
+    ])
+
+    # Clear the cart
+    CartItem.query.filter_by(user_id=user.id).delete()
+    refresh_cart_count(user.id)
+
+    # Sales and stock reporting happen after the response, off the request
+    enqueue('report_order', order_id=order.id)
+    db.session.commit()
+    return order
+
+
+@task('report_order')
+def report_order(order_id):
+    """Log a placed order and any of its products that are running low"""
+    items, quantity = (db.session.query(func.count(OrderItem.id), func.coalesce(func.sum(OrderItem.quantity), 0))
+                       .filter(OrderItem.order_id == order_id).one())
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    app.logger.info(f'Order {order.id} placed by user {order.user_id}: '
+                    f'{quantity} units in {items} lines, ${order.total_amount:.2f}')
+    low_stock = (db.session.query(Product.name, Product.stock)
+                 .join(OrderItem, OrderItem.product_id == Product.id)
+                 .filter(OrderItem.order_id == order_id, Product.stock <= LOW_STOCK_THRESHOLD)
+                 .all())
+    for name, stock in low_stock:
+        app.logger.warning(f'Low stock: {name} has {stock} left')
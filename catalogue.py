@@ -0,0 +1,75 @@
+import json
+from datetime import datetime
+
+from flask import Response, stream_with_context, url_for
+
+
+# Rows fetched per database round trip while streaming an export
+STREAM_BATCH_SIZE = 500
+
+# Fields the catalogue API can return, and the default selection
+PET_FIELDS = ('id', 'name', 'species', 'breed', 'age', 'gender', 'description',
+              'health_info', 'behavior_info', 'adoption_status', 'size', 'energy_level',
+              'good_with_children', 'good_with_other_pets', 'special_needs',
+              'training_level', 'image_url', 'created_at', 'updated_at')
+DEFAULT_PET_FIELDS = ('id', 'name', 'species', 'breed', 'age', 'gender', 'image_url')
+
+PRODUCT_FIELDS = ('id', 'name', 'category', 'price', 'description', 'stock',
+                  'image_url', 'created_at', 'updated_at')
+DEFAULT_PRODUCT_FIELDS = ('id', 'name', 'category', 'price', 'stock', 'image_url')
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+
+def select_fields(requested, allowed, default):
+    """Parse a comma-separated `fields` parameter; raises ValueError for unknown fields"""
+    if not requested:
+        return list(default)
+    fields = list(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or list(default)
+
+
+def field_columns(model, fields):
+    """Columns to select for the given fields, in the same order"""
+    return [model.image_filename if field == 'image_url' else getattr(model, field) for field in fields]
+
+
+def _json_value(field, value):
+    if field == 'image_url':
+        return url_for('static', filename=f'uploads/{value}', _external=True) if value else None
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _documents(query, model, fields):
+    # yield_per fetches in batches (a server-side cursor where the driver has one)
+    # and only the selected columns are loaded, so memory stays flat for any export size
+    rows = query.with_entities(*field_columns(model, fields)).yield_per(STREAM_BATCH_SIZE)
+    for row in rows:
+        yield json.dumps({field: _json_value(field, value) for field, value in zip(fields, row)},
+                         separators=(',', ':'))
+
+
+def stream_catalogue(query, model, fields, output_format='ndjson'):
+    """Stream a query as NDJSON (one object per line) or as a chunked JSON array"""
+    def generate():
+        if output_format == 'ndjson':
+            for document in _documents(query, model, fields):
+                yield document + '\n'
+            return
+        separator = '['
+        for document in _documents(query, model, fields):
+            yield separator + document
+            separator = ',\n'
+        yield '[]' if separator == '[' else ']'
+        yield '\n'
+
+    return Response(stream_with_context(generate()), mimetype=FORMATS[output_format])
+
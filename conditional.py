@@ -0,0 +1,92 @@
+import hashlib
+from collections import Counter
+
+from flask import g, request, session
+from flask_login import current_user
+from sqlalchemy import event, insert, select, update
+
+from app import app, db
+from cart import get_cart_count
+from models import Pet, Product, TableVersion
+
+# Models whose deletes are counted for table_watermark
+WATERMARKED_MODELS = (Pet, Product)
+
+
+def table_watermark(model, *criteria):
+    """
+    (latest updated_at, deletes so far) for a model's rows, a cheap
+    version stamp for listings. Both are single index lookups: the latest
+    change is read off an updated_at index (criteria should match its
+    leading columns) and deletes come from the model's TableVersion row.
+    """
+    changed, deleted = db.session.execute(watermark_query(model, *criteria)).one()
+    return changed, deleted or 0
+
+
+def watermark_query(model, *criteria):
+    latest_change = (select(model.updated_at).where(model.updated_at.isnot(None), *criteria)
+                     .order_by(model.updated_at.desc()).limit(1).scalar_subquery())
+    deletes = (select(TableVersion.deletes).where(TableVersion.table_name == model.__tablename__)
+               .scalar_subquery())
+    return select(latest_change, deletes)
+
+
+def _view_etag(parts):
+    # Rendered pages also depend on who is looking (navigation, cart badge) and on the release
+    viewer = (current_user.id, get_cart_count(current_user)) if current_user.is_authenticated else None
+    key = repr((request.endpoint, request.full_path, viewer, app.config.get('RELEASE_VERSION'), parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_get(*parts):
+    """
+    Answer a conditional GET before doing any rendering work.
+    `parts` are the row versions the page is built from (e.g. updated_at
+    stamps and listing watermarks). Returns a 304 response when the
+    client's ETag is current, otherwise None; the ETag is then attached
+    to the full response on its way out.
+
+    Only If-None-Match is honoured and no Last-Modified is sent: the page
+    also depends on deletes, the viewer and their cart, none of which
+    move a date, so If-Modified-Since would get stale 304s.
+    Pages carrying a form with a CSRF token must not use this, since the
+    token expires while a revalidated copy would keep serving it.
+    """
+    if request.method != 'GET' or session.get('_flashes'):
+        return None  # Pending flash messages make the page one-off
+
+    etag = _view_etag(parts)
+    g.conditional_etag = etag
+    if not request.if_none_match.contains(etag):
+        return None
+
+    response = app.response_class(status=304)
+    _set_validators(response, etag)
+    return response
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag)
+    # Per-user pages: browsers may keep them but must revalidate every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+
+
+@app.after_request
+def attach_conditional_validators(response):
+    etag = g.pop('conditional_etag', None)
+    if etag and response.status_code == 200:
+        _set_validators(response, etag)
+    return response
+
+
+# Count deletes in the same transaction, so a deleted row changes the watermark
+@event.listens_for(db.session, 'after_flush')
+def _count_deletes(session, flush_context):
+    deletes = Counter(obj.__tablename__ for obj in session.deleted if isinstance(obj, WATERMARKED_MODELS))
+    connection = session.connection()
+    for table_name, count in deletes.items():
+        bumped = connection.execute(update(TableVersion).where(TableVersion.table_name == table_name)
+                                    .values(deletes=TableVersion.deletes + count))
+        if not bumped.rowcount:
+            connection.execute(insert(TableVersion).values(table_name=table_name, deletes=count))
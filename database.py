@@ -0,0 +1,59 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+# Heroku-style URLs, which SQLAlchemy no longer accepts
+_LEGACY_POSTGRES_PREFIX = 'postgres://'
+
+
+def database_url(url):
+    """Normalise a DATABASE_URL value into a SQLAlchemy URL"""
+    if url.startswith(_LEGACY_POSTGRES_PREFIX):
+        return 'postgresql://' + url[len(_LEGACY_POSTGRES_PREFIX):]
+    return url
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the configured database"""
+    backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if backend == 'postgresql':
+        # Options passed to the server at connect time (milliseconds, 0 disables)
+        server_options = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"
+        return {
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': True,
+            # Reuse the most recent connection so surplus ones go idle and get recycled
+            'pool_use_lifo': True,
+            'connect_args': {'connect_timeout': config['DB_CONNECT_TIMEOUT'], 'options': server_options},
+        }
+    if backend == 'sqlite':
+        # A local file: no network to ping through or idle connections to recycle.
+        # Writers wait for the lock instead of failing with "database is locked".
+        return {'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000}}
+    return {'pool_recycle': config['DB_POOL_RECYCLE'], 'pool_pre_ping': True}
+
+
+def configure_engine(engine, config):
+    """Per-connection settings that can't be given as engine options"""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = [
+        # WAL lets readers in every worker process run while one connection writes
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        # Safe with WAL: a power loss can drop the last commits but never corrupts the file
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    ]
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
@@ -43,6 +43,10 @@ class PetRegistrationForm(FlaskForm):
     submit = SubmitField('Register Pet')
 
 
+class DeletePetForm(FlaskForm):
+    submit = SubmitField('Remove Listing')
+
+
 class DonationForm(FlaskForm):
     amount = FloatField('Donation Amount ($)', validators=[DataRequired(), NumberRange(min=1)])
     message = TextAreaField('Leave a Message (Optional)', validators=[Optional(), Length(max=500)])
@@ -0,0 +1,59 @@
+import threading
+import time
+
+from markupsafe import Markup
+
+from app import app
+
+
+class FragmentCache:
+    """
+    Cache of rendered HTML fragments for read-mostly page widgets.
+    Fragments are invalidated explicitly when the data behind them is
+    committed; the TTL only bounds staleness across worker processes.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._fragments = {}  # name -> (expires_at, html)
+        self._stats = {}  # name -> {'hits': n, 'misses': n, 'invalidations': n}
+        self._lock = threading.Lock()
+
+    def _counters(self, name):
+        return self._stats.setdefault(name, {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+    def render(self, name, render_fn):
+        """Return the cached fragment, calling render_fn() to build it on a miss"""
+        with self._lock:
+            cached = self._fragments.get(name)
+            if cached is not None and cached[0] > time.monotonic():
+                self._counters(name)['hits'] += 1
+                return cached[1]
+            self._counters(name)['misses'] += 1
+        html = Markup(render_fn())
+        with self._lock:
+            self._fragments[name] = (time.monotonic() + self.ttl, html)
+        return html
+
+    def invalidate(self, *names):
+        with self._lock:
+            for name in names:
+                self._fragments.pop(name, None)
+                self._counters(name)['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for name, counters in self._stats.items():
+                lookups = counters['hits'] + counters['misses']
+                stats[name] = dict(counters, hit_rate=round(counters['hits'] / lookups, 4) if lookups else 0.0)
+            return stats
+
+
+fragment_cache = FragmentCache(ttl=app.config.get('FRAGMENT_CACHE_TTL', 60))
+
+# Fragment names
+FEATURED_PETS = 'featured_pets'
+HOME_DONATIONS = 'home_donations'
+DONATION_TABLE = 'donation_table'
+DONATION_FRAGMENTS = (HOME_DONATIONS, DONATION_TABLE)
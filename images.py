@@ -0,0 +1,149 @@
+import glob
+import hashlib
+import os
+import tempfile
+
+import click
+from flask import url_for
+
+from app import app, db
+from fragments import fragment_cache, FEATURED_PETS
+from jobs import task, enqueue
+from models import Pet
+
+
+# Renditions generated for every pet photo: name -> (width, height, crop)
+# thumb: 70x70 "other pets" and profile tiles, card: 220px-high listing cards,
+# detail: the pet detail page. Sizes are 2x for high-density screens.
+RENDITIONS = {
+    'thumb': (160, 160, True),
+    'card': (640, 440, True),
+    'detail': (1200, 1200, False),
+}
+RENDITION_FORMAT = 'WEBP'
+RENDITION_EXTENSION = 'webp'
+RENDITION_QUALITY = 80
+RENDITION_METHOD = 4  # WebP encoder effort, 0 (fast) to 6
+RENDITION_FOLDER = 'renditions'
+
+
+def _rendition_version(rendition):
+    """Short hash of the settings a rendition is made with"""
+    width, height, crop = RENDITIONS[rendition]
+    settings = f'{width}x{height},{crop},{RENDITION_FORMAT},{RENDITION_QUALITY},{RENDITION_METHOD}'
+    return hashlib.sha1(settings.encode()).hexdigest()[:8]
+
+
+# Rendition -> its name in file names and Pet.image_variants. Renditions are served
+# as immutable, so changing a rendition's settings has to give it new URLs; photos
+# processed with older settings show the original until `flask process-images`.
+RENDITION_VERSIONS = {rendition: f'{rendition}-{_rendition_version(rendition)}' for rendition in RENDITIONS}
+
+
+def rendition_filename(image_filename, rendition):
+    """Path of a rendition relative to the upload folder"""
+    stem = os.path.splitext(image_filename)[0]
+    return f'{RENDITION_FOLDER}/{stem}-{RENDITION_VERSIONS[rendition]}.{RENDITION_EXTENSION}'
+
+
+def rendition_files(image_filename):
+    """Paths of every rendition of an image on disk, relative to the upload folder, older settings included"""
+    upload_folder = app.config['UPLOAD_FOLDER']
+    stem = glob.escape(os.path.splitext(image_filename)[0])
+    paths = glob.glob(os.path.join(upload_folder, RENDITION_FOLDER, f'{stem}-*.{RENDITION_EXTENSION}'))
+    return [os.path.relpath(path, upload_folder) for path in paths]
+
+
+def all_renditions_exist(image_filename):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    return all(os.path.exists(os.path.join(upload_folder, rendition_filename(image_filename, rendition)))
+               for rendition in RENDITIONS)
+
+
+def make_renditions(image_filename):
+    """Write every rendition of an uploaded image; returns their versioned names"""
+    # Pillow is only imported by the processes that resize images (the job workers)
+    from PIL import Image, ImageOps
+
+    upload_folder = app.config['UPLOAD_FOLDER']
+    written = []
+    with Image.open(os.path.join(upload_folder, image_filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        for rendition, (width, height, crop) in RENDITIONS.items():
+            if crop:
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, height), Image.LANCZOS)
+            path = os.path.join(upload_folder, rendition_filename(image_filename, rendition))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary name so a half-written file is never served
+            handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(handle, 'wb') as temp_file:
+                resized.save(temp_file, RENDITION_FORMAT, quality=RENDITION_QUALITY, method=RENDITION_METHOD)
+            os.replace(temp_path, path)
+            written.append(RENDITION_VERSIONS[rendition])
+    return written
+
+
+@task('process_pet_image')
+def process_pet_image(pet_id, image_filename):
+    """Generate the renditions for a pet photo and record them on the pet"""
+    from PIL import UnidentifiedImageError
+
+    # The pet may have been deleted (and its photo released) since the job was queued
+    pet_id = db.session.query(Pet.id).filter_by(id=pet_id, image_filename=image_filename).scalar()
+    if pet_id is None:
+        return
+    if all_renditions_exist(image_filename):
+        # Content-addressed duplicate of a photo that was already processed
+        variants = list(RENDITION_VERSIONS.values())
+    else:
+        try:
+            variants = make_renditions(image_filename)
+        except UnidentifiedImageError as e:
+            # Not an image Pillow can read; retrying won't help (I/O errors are retried)
+            app.logger.error(f"Error processing image {image_filename}: {str(e)}")
+            return
+        except FileNotFoundError:
+            # Released by a delete that committed after the check above; nothing left to resize
+            return
+    Pet.query.filter_by(id=pet_id, image_filename=image_filename).update(
+        {'image_variants': ','.join(variants)}, synchronize_session=False)
+    db.session.commit()
+    # Cached fragments may still point at the original upload
+    fragment_cache.invalidate(FEATURED_PETS)
+
+
+def queue_pet_image(pet):
+    """Queue resizing a pet photo; committed with the pet (which must be flushed)"""
+    if pet.image_filename:
+        enqueue('process_pet_image', pet_id=pet.id, image_filename=pet.image_filename)
+
+
+@app.template_global()
+def pet_image_url(pet, rendition):
+    """URL of the smallest suitable image for a pet, falling back to the original upload"""
+    if not pet.image_filename:
+        return None
+    if pet.image_variants and RENDITION_VERSIONS[rendition] in pet.image_variants.split(','):
+        filename = rendition_filename(pet.image_filename, rendition)
+    else:
+        filename = pet.image_filename
+    return url_for('static', filename=f'uploads/{filename}')
+
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Generate missing or outdated renditions for existing pet photos."""
+    current = ','.join(RENDITION_VERSIONS.values())
+    pets = Pet.query.filter(Pet.image_filename.isnot(None),
+                            Pet.image_variants.is_(None) | (Pet.image_variants != current)).all()
+    for pet in pets:
+        try:
+            process_pet_image(pet.id, pet.image_filename)
+        except OSError as e:
+            app.logger.error(f"Error processing image {pet.image_filename}: {str(e)}")
+    click.echo(f'Processed {len(pets)} pet images')
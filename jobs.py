@@ -0,0 +1,218 @@
+import json
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+import click
+from flask import request
+from sqlalchemy import event, func
+
+from app import app, db
+from models import Job
+
+
+# Task name -> function, filled in by the @task decorator
+TASKS = {}
+
+# Set whenever a commit enqueues work, so idle workers don't wait for the next poll
+_wakeup = threading.Event()
+_workers = []
+_workers_lock = threading.Lock()
+# time.monotonic() when this process's workers next look for stale jobs (first: right away)
+_next_stale_check = 0.0
+_stale_check_lock = threading.Lock()
+
+
+def task(name):
+    """Register a function as a background task; it is called with the job's keyword arguments"""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    """
+    Add a job to the current session. It is committed together with the
+    caller's changes, so work is only queued for changes that were saved.
+    """
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    job = Job(name=name, payload=json.dumps(payload),
+              run_at=datetime.utcnow() + timedelta(seconds=delay),
+              max_attempts=max_attempts or app.config.get('JOB_MAX_ATTEMPTS', 5))
+    db.session.add(job)
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+def after_commit(callback):
+    """
+    Run `callback` once the current transaction commits (dropped on
+    rollback). For in-process side effects such as cache invalidation,
+    which every worker process has to do for itself.
+    """
+    db.session.info.setdefault('after_commit_callbacks', []).append(callback)
+
+
+def _claim():
+    """Claim the next runnable job; None when there is nothing to do"""
+    while True:
+        now = datetime.utcnow()
+        job_id = (db.session.query(Job.id)
+                  .filter(Job.status == 'queued', Job.run_at <= now)
+                  .order_by(Job.run_at, Job.id)
+                  .limit(1).scalar())
+        if job_id is None:
+            return None
+        # Only one worker can move the job out of 'queued'
+        claimed = (Job.query.filter(Job.id == job_id, Job.status == 'queued')
+                   .update({'status': 'running', 'locked_at': now, 'attempts': Job.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job_id)
+
+
+def run_next_job():
+    """Claim and run one job. Returns False when the queue had nothing runnable."""
+    job = _claim()
+    if job is None:
+        return False
+    job_id, name, attempts, max_attempts = job.id, job.name, job.attempts, job.max_attempts
+    try:
+        TASKS[name](**json.loads(job.payload))
+    except Exception as e:
+        db.session.rollback()
+        error = ''.join(traceback.format_exception(e))
+        if attempts >= max_attempts:
+            # Dead-lettered: kept for inspection, rerun with `flask retry-dead-jobs`
+            changes = {'status': 'dead', 'last_error': error}
+            app.logger.error(f'Job {job_id} ({name}) failed permanently after {attempts} attempts: {str(e)}')
+        else:
+            backoff = app.config.get('JOB_RETRY_DELAY', 10) * 2 ** (attempts - 1)
+            changes = {'status': 'queued', 'last_error': error,
+                       'run_at': datetime.utcnow() + timedelta(seconds=backoff)}
+            app.logger.warning(f'Job {job_id} ({name}) failed, retrying in {backoff}s: {str(e)}')
+        Job.query.filter_by(id=job_id).update(changes, synchronize_session=False)
+    else:
+        # Finished jobs aren't kept
+        Job.query.filter_by(id=job_id).delete(synchronize_session=False)
+    db.session.commit()
+    return True
+
+
+def requeue_stale_jobs():
+    """
+    Put back jobs whose worker died while running them: those running for
+    longer than JOB_TIMEOUT. A job that was merely slow is then run again
+    alongside the first run.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config.get('JOB_TIMEOUT', 600))
+    requeued = (Job.query.filter(Job.status == 'running', Job.locked_at < cutoff)
+                .update({'status': 'queued', 'run_at': datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    if requeued:
+        app.logger.warning(f'Requeued {requeued} stale jobs')
+    return requeued
+
+
+def _stale_check_due():
+    """True for one worker per JOB_TIMEOUT/2, which then requeues stale jobs"""
+    global _next_stale_check
+    now = time.monotonic()
+    with _stale_check_lock:
+        if now < _next_stale_check:
+            return False
+        _next_stale_check = now + app.config.get('JOB_TIMEOUT', 600) / 2
+        return True
+
+
+def _work(stop):
+    poll_interval = app.config.get('JOB_POLL_INTERVAL', 5)
+    while not stop.is_set():
+        ran = False
+        with app.app_context():
+            try:
+                # Jobs left running by a worker process that crashed, while this one stays up
+                if _stale_check_due():
+                    requeue_stale_jobs()
+                ran = run_next_job()
+            except Exception as e:
+                app.logger.error(f'Job worker error: {str(e)}')
+            finally:
+                db.session.remove()
+        if not ran:
+            _wakeup.wait(poll_interval)
+            _wakeup.clear()
+
+
+def start_workers(count=None):
+    """Start the background worker threads once per process; returns the stop event"""
+    count = app.config.get('JOB_WORKERS', 2) if count is None else count
+    with _workers_lock:
+        if _workers or count <= 0:
+            return None
+        stop = threading.Event()
+        for number in range(count):
+            worker = threading.Thread(target=_work, args=(stop,), name=f'job-worker-{number}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+        return stop
+
+
+def queue_stats():
+    counts = dict(db.session.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    return {
+        'queued': counts.get('queued', 0),
+        'running': counts.get('running', 0),
+        'dead': counts.get('dead', 0),
+        'workers': len(_workers)
+    }
+
+
+# Web processes start their worker pool with the first request
+@app.before_request
+def _start_web_workers():
+    if not _workers and request.endpoint != 'static':
+        start_workers()
+
+
+@event.listens_for(db.session, 'after_commit')
+def _after_commit(session):
+    callbacks = session.info.pop('after_commit_callbacks', ())
+    for callback in callbacks:
+        callback()
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _after_rollback(session):
+    session.info.pop('after_commit_callbacks', None)
+    session.info.pop('jobs_enqueued', None)
+
+
+@app.cli.command('run-jobs')
+@click.option('--workers', default=2, help='Worker threads in this process.')
+def run_jobs_command(workers):
+    """Run background jobs in the foreground (e.g. a dedicated worker process)."""
+    stop = start_workers(workers)
+    click.echo(f'Running jobs with {workers} workers, Ctrl+C to stop')
+    try:
+        while True:
+            threading.Event().wait(3600)
+    except KeyboardInterrupt:
+        if stop:
+            stop.set()
+
+
+@app.cli.command('retry-dead-jobs')
+def retry_dead_jobs_command():
+    """Queue dead-lettered jobs for another round of attempts."""
+    retried = (Job.query.filter_by(status='dead')
+               .update({'status': 'queued', 'attempts': 0, 'run_at': datetime.utcnow()},
+                       synchronize_session=False))
+    db.session.commit()
+    click.echo(f'Requeued {retried} dead jobs')
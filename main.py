@@ -1,4 +1,16 @@
-from app import app
+from wsgi import app
 
 if __name__ == "__main__":
+    # The development server sets up its own database; deployments run
+    # `flask init-db` (and `flask seed-db` for the sample data) before starting workers
+    from routes import init_db, initialize_db
+    with app.app_context():
+        init_db()
+        initialize_db()
     app.run(host="0.0.0.0", port=5000, debug=True)
+else:
+    # Served by gunicorn: refuse to boot on a database `flask init-db` hasn't
+    # created or upgraded, rather than answering its first requests with errors
+    from models import check_schema
+    with app.app_context():
+        check_schema()
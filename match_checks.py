@@ -0,0 +1,248 @@
+"""
+Equivalence checks for the pet match scoring code.
+
+routes.calculate_match_score and routes.add_pet_matching_attributes are
+the reference implementations. The checks generate random pets and
+preference sets from a seeded generator and compare every other
+implementation against them, value for value:
+
+  check_scores    a scorer's 0-100 scores against calculate_match_score,
+                  for every pet and preference set
+  check_ranking   MatchEngine.matches and top_matches_batch against
+                  sorting the reference scores (score descending, then pet id)
+  check_derived   pet_import.MatchingAttributes against add_pet_matching_attributes
+
+Generated values go beyond what the forms allow: missing and empty
+attributes, age boundaries, unknown species and sizes, and truthy
+non-boolean flags as the JSON API passes them. Preference sets also
+cover every combination the pet match form can produce. A mismatch is
+shrunk to a small failing case and raised as Mismatch.
+
+tests/test_match_equivalence.py runs them with a fixed seed;
+benchmarks/match_oracle.py runs them from the command line.
+"""
+import itertools
+from types import SimpleNamespace
+
+import numpy as np
+
+
+# Pet attribute values to draw from: form choices, boundaries and values the forms never produce
+PET_VALUES = {
+    'species': ['dog', 'cat', 'bird', 'rabbit', 'other', 'hamster', 'Dog', ''],
+    'age': [None, 0, 1, 11, 12, 13, 23, 24, 25, 83, 84, 85, 119, 120, 121, 240, -1],
+    'gender': ['male', 'female', 'unknown', None, ''],
+    'size': ['small', 'medium', 'large', None, '', 'giant'],
+    'energy_level': ['low', 'medium', 'high', None, '', 'extreme'],
+    'good_with_children': [False, True, None],
+    'good_with_other_pets': [False, True, None],
+    'special_needs': [False, True, None],
+}
+PREFERENCE_VALUES = {
+    'species': ['dog', 'cat', 'bird', 'rabbit', 'other', 'any', 'fish', ''],
+    'age_preference': ['any', 'baby', 'adult', 'senior', 'puppy', ''],
+    'gender_preference': ['any', 'male', 'female', 'unknown', '', None],
+    'size_preference': ['any', 'small', 'medium', 'large', 'giant', ''],
+    'energy_level': ['any', 'low', 'medium', 'high', 'extreme', ''],
+    'good_with_children': [False, True, None, 0, 1, 'yes', ''],
+    'good_with_other_pets': [False, True, None, 0, 1, 'yes', ''],
+    'special_needs': [False, True, None, 0, 1, 'yes', ''],
+}
+# Preference values the pet match form can submit (after its yes/no conversion)
+FORM_PREFERENCES = {
+    'species': ['dog', 'cat', 'bird', 'rabbit', 'other'],
+    'age_preference': ['baby', 'adult', 'senior', 'any'],
+    'gender_preference': ['male', 'female', 'any'],
+    'size_preference': ['small', 'medium', 'large', 'any'],
+    'energy_level': ['low', 'medium', 'high', 'any'],
+    'good_with_children': [True, False],
+    'good_with_other_pets': [True, False],
+    'special_needs': [True, False],
+}
+# Inputs of add_pet_matching_attributes
+BREEDS = [None, '', 'Labrador Retriever', 'labrador', 'Golden Retriever Mix', 'German Shepherd', 'Beagle',
+          'Chihuahua', 'POMERANIAN', 'Yorkshire Terrier', 'Shih Tzu', 'Maltese', 'Boxer', 'Rottweiler',
+          'Maine Coon', 'maine coon mix', 'Siamese', 'Mixed Breed', 'Labradoodle', 'Beagle / Chihuahua']
+DERIVED_SPECIES = ['dog', 'cat', 'bird', 'rabbit', 'other', 'Dog']
+DERIVED_AGES = [None, 0, 1, 11, 12, 13, 23, 24, 25, 84, 85, 120, 121, 200, -1]
+
+
+class Mismatch(AssertionError):
+    pass
+
+
+def random_value(rng, values):
+    # Mostly the listed values, sometimes any small integer for numbers
+    if values is PET_VALUES['age'] and rng.random() < 0.2:
+        return rng.randint(0, 300)
+    return rng.choice(values)
+
+
+def random_rows(rng, count, first_id=1):
+    """Match rows (matching.MATCH_COLUMNS order) of available pets with unique ids"""
+    ids = rng.sample(range(first_id, first_id + count * 10), count)
+    return [(pet_id,) + tuple(random_value(rng, values) for values in PET_VALUES.values()) + ('available',)
+            for pet_id in ids]
+
+
+def random_profile(rng, values=PREFERENCE_VALUES):
+    profile = {field: random_value(rng, choices) for field, choices in values.items()}
+    # Fields the score ignores, present as they are in real requests
+    profile.update(living_environment='apartment', time_availability='moderate', training_preference='any')
+    return profile
+
+
+def form_profiles():
+    """Every preference set the pet match form can produce"""
+    fields = list(FORM_PREFERENCES)
+    for combination in itertools.product(*FORM_PREFERENCES.values()):
+        yield dict(zip(fields, combination))
+
+
+def as_pet(row):
+    from matching import MATCH_COLUMNS
+
+    return SimpleNamespace(**dict(zip(MATCH_COLUMNS, row)))
+
+
+def reference_scores(rows, profiles):
+    from routes import calculate_match_score
+
+    pets = [as_pet(row) for row in rows]
+    return [[calculate_match_score(pet, profile) for pet in pets] for profile in profiles]
+
+
+def engine_scores(rows, profiles):
+    from matching import MatchEngine
+
+    ids, scores = MatchEngine.from_rows(rows).score_many(profiles)
+    position = {int(pet_id): index for index, pet_id in enumerate(ids)}
+    order = [position[row[0]] for row in rows]
+    return [[int(value) for value in row[order]] for row in scores]
+
+
+SCORERS = {'engine': engine_scores}
+
+
+def first_difference(rows, profiles, scorer):
+    """(row index, profile index, expected, actual) of the first differing score, or None"""
+    expected = reference_scores(rows, profiles)
+    actual = scorer(rows, profiles)
+    if len(actual) != len(profiles):
+        raise Mismatch(f'Scorer returned {len(actual)} score rows for {len(profiles)} preference sets')
+    for profile_index, (wanted, got) in enumerate(zip(expected, actual)):
+        got = list(got)
+        if len(got) != len(rows):
+            raise Mismatch(f'Scorer returned {len(got)} scores for {len(rows)} pets')
+        for row_index, (a, b) in enumerate(zip(wanted, got)):
+            # Same value and an integer type, so float scores don't pass as equal
+            if a != b or not isinstance(b, (int, np.integer)) or isinstance(b, bool):
+                return row_index, profile_index, a, b
+    return None
+
+
+def shrink(row, profile, scorer):
+    """Simplify a failing (pet, preferences) pair one field at a time while it still fails"""
+    from matching import MATCH_COLUMNS
+
+    row, profile = list(row), dict(profile)
+    changed = True
+    while changed:
+        changed = False
+        for index, column in enumerate(MATCH_COLUMNS[1:-1], start=1):
+            for value in PET_VALUES[column]:
+                if value == row[index] and type(value) is type(row[index]):
+                    break
+                candidate = row[:index] + [value] + row[index + 1:]
+                if first_difference([tuple(candidate)], [profile], scorer):
+                    row, changed = candidate, True
+                    break
+        for field, values in PREFERENCE_VALUES.items():
+            for value in values:
+                if value == profile[field] and type(value) is type(profile[field]):
+                    break
+                candidate = dict(profile, **{field: value})
+                if first_difference([tuple(row)], [candidate], scorer):
+                    profile, changed = candidate, True
+                    break
+    return tuple(row), profile
+
+
+def check_scores(rng, scorer, cases, pets):
+    """Random catalogues against random and form preference sets"""
+    for case in range(cases):
+        rows = random_rows(rng, rng.randint(1, pets))
+        profiles = [random_profile(rng) for _ in range(rng.randint(1, 8))]
+        difference = first_difference(rows, profiles, scorer)
+        if difference:
+            row_index, profile_index, _, _ = difference
+            row, profile = shrink(rows[row_index], profiles[profile_index], scorer)
+            _, _, expected, actual = first_difference([row], [profile], scorer)
+            raise Mismatch(f'Case {case}: score {actual!r}, reference {expected!r}\n'
+                           f'  pet row: {row}\n  preferences: {profile}')
+
+    rows = random_rows(rng, pets)
+    profiles = list(form_profiles())
+    difference = first_difference(rows, profiles, scorer)
+    if difference:
+        row_index, profile_index, expected, actual = difference
+        raise Mismatch(f'Form preferences: score {actual!r}, reference {expected!r}\n'
+                       f'  pet row: {rows[row_index]}\n  preferences: {profiles[profile_index]}')
+    return cases + 1
+
+
+def check_ranking(rng, cases, pets):
+    """MatchEngine rankings against the sorted reference scores"""
+    from matching import MatchEngine
+
+    for case in range(cases):
+        rows = random_rows(rng, rng.randint(1, pets))
+        profiles = [random_profile(rng) for _ in range(rng.randint(1, 8))]
+        min_score = rng.choice([0, 1, 50, 70, 100])
+        limit = rng.randint(1, len(rows) + 2)
+        engine = MatchEngine.from_rows(rows)
+        batch = engine.top_matches_batch(profiles, limit, min_score=min_score)
+        for profile, scores, (page, total) in zip(profiles, reference_scores(rows, profiles), batch):
+            expected = sorted(((row[0], score) for row, score in zip(rows, scores) if score >= min_score),
+                              key=lambda match: (-match[1], match[0]))
+            if engine.matches(profile, min_score=min_score) != expected:
+                raise Mismatch(f'Case {case}: matches() differs from the reference ranking for {profile}')
+            if page != expected[:limit] or total != len(expected):
+                raise Mismatch(f'Case {case}: top_matches_batch() differs from the reference ranking '
+                               f'(limit {limit}, min_score {min_score}) for {profile}')
+    return cases
+
+
+def new_pet_defaults():
+    """Attribute values of a freshly inserted Pet that add_pet_matching_attributes may leave alone"""
+    from models import Pet
+    from pet_import import DERIVED_FIELDS
+
+    defaults = {}
+    for field in DERIVED_FIELDS:
+        default = Pet.__table__.c[field].default
+        defaults[field] = default.arg if default is not None else None
+    return defaults
+
+
+def check_derived(rng, cases):
+    """MatchingAttributes (cached, with evictions) against add_pet_matching_attributes"""
+    from pet_import import DERIVED_FIELDS, MatchingAttributes
+    from routes import add_pet_matching_attributes
+
+    defaults = new_pet_defaults()
+    combinations = list(itertools.product(DERIVED_SPECIES, BREEDS, DERIVED_AGES))
+    inputs = combinations + [(rng.choice(DERIVED_SPECIES), rng.choice(BREEDS), rng.randint(0, 300))
+                             for _ in range(cases)]
+    rng.shuffle(inputs)
+    # A small cache so entries are evicted and derived again along the way
+    for attributes in (MatchingAttributes(), MatchingAttributes(max_entries=7)):
+        for species, breed, age in inputs + inputs[:200]:
+            pet = SimpleNamespace(species=species, breed=breed, age=age, **defaults)
+            add_pet_matching_attributes(pet)
+            expected = tuple(getattr(pet, field) for field in DERIVED_FIELDS)
+            actual = attributes.derive(species, breed, age)
+            if actual != expected or list(map(type, actual)) != list(map(type, expected)):
+                raise Mismatch(f'MatchingAttributes.derive{(species, breed, age)} returned {actual!r}, '
+                               f'add_pet_matching_attributes gives {expected!r}')
+    return len(inputs)
@@ -0,0 +1,542 @@
+import base64
+import binascii
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import event
+
+from app import app, db
+from models import Pet
+
+
+# Attributes the match engine keeps in its columnar snapshot
+MATCH_COLUMNS = ('id', 'species', 'age', 'gender', 'size', 'energy_level',
+                 'good_with_children', 'good_with_other_pets', 'special_needs',
+                 'adoption_status')
+
+
+# Pet ids are packed below the score when ranking by (score desc, id asc)
+_ID_BITS = 40
+_ID_MASK = (1 << _ID_BITS) - 1
+
+# Preference fields that affect the match score, in cache key order
+SCORED_PREFERENCES = ('species', 'age_preference', 'gender_preference', 'size_preference',
+                      'energy_level', 'good_with_children', 'good_with_other_pets', 'special_needs')
+_FLAG_PREFERENCES = ('good_with_children', 'good_with_other_pets', 'special_needs')
+
+# Snapshot arrays the scorer reads (MatchEngine attributes without the underscore)
+_SNAPSHOT_ARRAYS = ('ids', 'species', 'age', 'has_age', 'gender', 'size', 'has_size',
+                    'energy', 'has_energy', 'good_with_children', 'good_with_other_pets',
+                    'special_needs')
+
+# Upper bound on profiles x pets cells scored at once by top_matches_batch
+BATCH_CELLS = 2_000_000
+
+
+def encode_cursor(score, pet_id):
+    """Opaque cursor pointing just after the (score, pet_id) match"""
+    return base64.urlsafe_b64encode(f'{score}:{pet_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        score, pet_id = raw.split(':')
+        return int(score), int(pet_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def preference_key(preferences, min_score):
+    """
+    Canonical, hashable form of a preference dict. Fields that don't
+    affect the score (living environment, time availability, ...) are
+    dropped and the flags are reduced to booleans, so equivalent queries
+    from the HTML form and the JSON API share one cache entry.
+    """
+    key = []
+    for field in SCORED_PREFERENCES:
+        value = preferences.get(field)
+        if field in _FLAG_PREFERENCES:
+            value = bool(value)
+        elif not isinstance(value, (str, int, float, type(None))):
+            value = repr(value)
+        key.append(value)
+    return tuple(key) + (min_score,)
+
+
+class MatchResultCache:
+    """
+    Bounded LRU cache of ranked match results with a TTL. Entries are
+    tagged with the engine version they were computed against, so any
+    pet change makes them stale without having to walk the cache.
+    """
+
+    def __init__(self, max_entries=128, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl
+            }
+
+
+def pet_match_row(pet):
+    """Extract the match attributes of a Pet (or a column row) as a tuple"""
+    return tuple(getattr(pet, column) for column in MATCH_COLUMNS)
+
+
+class _Vocabulary:
+    """Maps the string values of a column to small integer codes"""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.codes)
+            self.codes[value] = code
+        return code
+
+    def lookup(self, value):
+        # Values never seen on a pet can't match anything
+        try:
+            return self.codes.get(value, -1)
+        except TypeError:
+            return -1
+
+
+class MatchEngine:
+    """
+    Columnar, array-backed snapshot of the match attributes of every
+    available pet. Scores all candidates for a preference set in one
+    batched NumPy pass and returns the same 0-100 scores as
+    routes.calculate_match_score.
+    """
+
+    def __init__(self, max_age=300, cache_size=128, cache_ttl=300):
+        self.max_age = max_age
+        self.results = MatchResultCache(max_entries=cache_size, ttl=cache_ttl)
+        # Bumped on every snapshot change; cached results carry the version they saw
+        self.version = 0
+        self._lock = threading.RLock()
+        self._loaded_at = None
+        self._reset(capacity=0)
+
+    def _reset(self, capacity):
+        self._species_vocab = _Vocabulary()
+        self._gender_vocab = _Vocabulary()
+        self._size_vocab = _Vocabulary()
+        self._energy_vocab = _Vocabulary()
+        self._rows = {}  # pet id -> row index
+        self._count = 0
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._species = np.zeros(capacity, dtype=np.int32)
+        self._age = np.zeros(capacity, dtype=np.int64)
+        self._has_age = np.zeros(capacity, dtype=bool)
+        self._gender = np.zeros(capacity, dtype=np.int32)
+        self._size = np.zeros(capacity, dtype=np.int32)
+        self._has_size = np.zeros(capacity, dtype=bool)
+        self._energy = np.zeros(capacity, dtype=np.int32)
+        self._has_energy = np.zeros(capacity, dtype=bool)
+        self._good_with_children = np.zeros(capacity, dtype=bool)
+        self._good_with_other_pets = np.zeros(capacity, dtype=bool)
+        self._special_needs = np.zeros(capacity, dtype=bool)
+
+    def _grow(self, needed):
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 64)
+        for name in ('_ids', '_active', '_species', '_age', '_has_age', '_gender',
+                     '_size', '_has_size', '_energy', '_has_energy',
+                     '_good_with_children', '_good_with_other_pets', '_special_needs'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _write(self, index, row):
+        (pet_id, species, age, gender, size, energy_level,
+         good_with_children, good_with_other_pets, special_needs, _status) = row
+        self._ids[index] = pet_id
+        self._active[index] = True
+        self._species[index] = self._species_vocab.encode(species)
+        self._has_age[index] = age is not None
+        self._age[index] = age if age is not None else 0
+        self._gender[index] = self._gender_vocab.encode(gender)
+        self._has_size[index] = bool(size)
+        self._size[index] = self._size_vocab.encode(size)
+        self._has_energy[index] = bool(energy_level)
+        self._energy[index] = self._energy_vocab.encode(energy_level)
+        self._good_with_children[index] = bool(good_with_children)
+        self._good_with_other_pets[index] = bool(good_with_other_pets)
+        self._special_needs[index] = bool(special_needs)
+
+    def load(self):
+        """Rebuild the snapshot from the database with a column-only query"""
+        columns = [getattr(Pet, column) for column in MATCH_COLUMNS]
+        rows = db.session.query(*columns).filter(Pet.adoption_status == 'available').all()
+        self._fill(rows)
+        app.logger.info(f'Match engine loaded {len(rows)} available pets')
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Detached engine over the given match rows that never reads the database"""
+        engine = cls(max_age=float('inf'), cache_size=0)
+        engine._fill(rows)
+        return engine
+
+    def _fill(self, rows):
+        with self._lock:
+            self._reset(capacity=len(rows))
+            for row in rows:
+                self._rows[row[0]] = self._count
+                self._write(self._count, tuple(row))
+                self._count += 1
+            self._loaded_at = time.monotonic()
+            self.version += 1
+        self.results.clear()
+
+    def invalidate(self):
+        """Force a full reload on the next scoring call"""
+        with self._lock:
+            self._loaded_at = None
+            self.version += 1
+        self.results.clear()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age:
+            self.load()
+
+    def apply(self, row):
+        """Incrementally add, refresh or drop a single pet given its match row"""
+        with self._lock:
+            self.version += 1
+            if self._loaded_at is None:
+                return  # The next load picks the change up
+            pet_id, status = row[0], row[-1]
+            index = self._rows.get(pet_id)
+            if status != 'available':
+                if index is not None:
+                    self._active[index] = False
+                    del self._rows[pet_id]
+                return
+            if index is None:
+                self._grow(self._count + 1)
+                index = self._count
+                self._rows[pet_id] = index
+                self._count += 1
+            self._write(index, row)
+
+    def discard(self, pet_id):
+        with self._lock:
+            self.version += 1
+            index = self._rows.pop(pet_id, None)
+            if index is not None:
+                self._active[index] = False
+
+    def _snapshot(self):
+        """
+        Consistent copy of the active rows plus the vocabularies that
+        encode them (a reload swaps in new vocabularies, so these stay valid)
+        """
+        self._ensure_loaded()
+        with self._lock:
+            n = self._count
+            active = self._active[:n]
+            columns = {name: getattr(self, f'_{name}')[:n][active] for name in _SNAPSHOT_ARRAYS}
+            vocabularies = (self._species_vocab, self._gender_vocab, self._size_vocab, self._energy_vocab)
+        return columns, vocabularies
+
+    @staticmethod
+    def _score_profiles(snapshot, profiles):
+        """
+        Score a snapshot against a list of preference sets in one
+        broadcast pass: preferences vary along the rows and pets along
+        the columns of every intermediate matrix.
+        """
+        columns, (species_vocab, gender_vocab, size_vocab, energy_vocab) = snapshot
+        age, has_age = columns['age'], columns['has_age']
+        gender = columns['gender']
+        size, has_size = columns['size'], columns['has_size']
+        energy, has_energy = columns['energy'], columns['has_energy']
+
+        def per_profile(values, dtype=bool):
+            # Column vector, one entry per preference set
+            return np.array(values, dtype=dtype).reshape(-1, 1)
+
+        shape = (len(profiles), len(columns['ids']))
+        score = np.full(shape, 20, dtype=np.int64)
+        max_score = np.full(shape, 20, dtype=np.int64)
+
+        # Age preference
+        age_preference = [p['age_preference'] for p in profiles]
+        wants_age = per_profile([a != 'any' for a in age_preference])
+        in_range = ((per_profile([a == 'baby' for a in age_preference]) & (age <= 12)) |
+                    (per_profile([a == 'adult' for a in age_preference]) & (age > 12) & (age <= 84)) |
+                    (per_profile([a == 'senior' for a in age_preference]) & (age > 84)))
+        max_score += np.where(wants_age, 15, 0)
+        score += np.where(wants_age & has_age & in_range, 15, 0)
+
+        # Gender preference
+        wants_gender = per_profile([p['gender_preference'] != 'any' for p in profiles])
+        gender_code = per_profile([gender_vocab.lookup(p['gender_preference']) for p in profiles], np.int32)
+        max_score += np.where(wants_gender, 10, 0)
+        score += np.where(wants_gender & (gender == gender_code), 10, 0)
+
+        # Size preference
+        wants_size = per_profile([p['size_preference'] != 'any' for p in profiles]) & has_size
+        size_code = per_profile([size_vocab.lookup(p['size_preference']) for p in profiles], np.int32)
+        max_score += np.where(wants_size, 10, 0)
+        score += np.where(wants_size & (size == size_code), 10, 0)
+
+        # Energy level, with partial credit for close matches
+        energy_preference = [p['energy_level'] for p in profiles]
+        wants_energy = per_profile([e != 'any' for e in energy_preference]) & has_energy
+        energy_code = per_profile([energy_vocab.lookup(e) for e in energy_preference], np.int32)
+        partial = ((per_profile([e in ('low', 'high') for e in energy_preference]) &
+                    (energy == energy_vocab.lookup('medium'))) |
+                   (per_profile([e == 'medium' for e in energy_preference]) &
+                    np.isin(energy, [energy_vocab.lookup('low'), energy_vocab.lookup('high')])))
+        max_score += np.where(wants_energy, 15, 0)
+        score += np.where(wants_energy & (energy == energy_code), 15,
+                          np.where(wants_energy & partial, 7, 0))
+
+        wants_children = per_profile([bool(p['good_with_children']) for p in profiles])
+        max_score += np.where(wants_children, 10, 0)
+        score += np.where(wants_children & columns['good_with_children'], 10, 0)
+
+        wants_other_pets = per_profile([bool(p['good_with_other_pets']) for p in profiles])
+        max_score += np.where(wants_other_pets, 10, 0)
+        score += np.where(wants_other_pets & columns['good_with_other_pets'], 10, 0)
+
+        # Special needs
+        accepts_special_needs = per_profile([bool(p['special_needs']) for p in profiles])
+        max_score += np.where(accepts_special_needs, 5, np.where(columns['special_needs'], 10, 0))
+        score += np.where(accepts_special_needs, 5, 0)
+
+        # Default to 50% when there isn't enough information to match on
+        sparse = max_score < 30
+        score = np.where(sparse, 50, score)
+        max_score = np.where(sparse, 50, max_score)
+
+        percent = np.minimum(100, np.ceil((score / max_score) * 100)).astype(np.int64)
+        # Species must match, no partial credit
+        species_code = per_profile([species_vocab.lookup(p['species']) for p in profiles], np.int32)
+        percent[columns['species'] != species_code] = 0
+        return percent
+
+    def score(self, preferences):
+        """
+        Score every available pet against the preferences.
+        Returns (pet_ids, scores) as parallel NumPy arrays.
+        """
+        ids, scores = self.score_many([preferences])
+        return ids, scores[0]
+
+    def score_many(self, profiles):
+        """
+        Score every available pet against each of a list of preference
+        sets. Returns (pet_ids, scores) where scores has one row per set.
+        """
+        snapshot = self._snapshot()
+        return snapshot[0]['ids'], self._score_profiles(snapshot, profiles)
+
+    def top_matches_batch(self, profiles, limit, min_score=50):
+        """
+        Top `limit` matches for each of many preference sets, scored
+        against one snapshot. Returns [(page, total), ...] in input order,
+        with page and total as in top_matches. Identical preference sets
+        are scored once, each set only against pets of its species, and
+        the profiles x pets matrix is built in slices of about
+        BATCH_CELLS entries to bound memory.
+        """
+        columns, vocabularies = self._snapshot()
+        species_vocab = vocabularies[0]
+
+        # Score each distinct preference set once
+        slots = {}
+        unique = []
+        positions = []
+        for preferences in profiles:
+            key = preference_key(preferences, min_score)
+            if key not in slots:
+                slots[key] = len(unique)
+                unique.append(preferences)
+            positions.append(slots[key])
+
+        # Other species score 0, so above a positive min_score only same-species pets can match
+        groups = {}
+        for slot, preferences in enumerate(unique):
+            species_code = species_vocab.lookup(preferences['species']) if min_score > 0 else None
+            groups.setdefault(species_code, []).append(slot)
+
+        results = [([], 0)] * len(unique)
+        for species_code, group in groups.items():
+            subset = columns
+            if species_code is not None:
+                in_species = columns['species'] == species_code
+                subset = {name: values[in_species] for name, values in columns.items()}
+            ids = subset['ids']
+            if not len(ids):
+                continue
+            step = max(1, BATCH_CELLS // len(ids))
+            for start in range(0, len(group), step):
+                chunk = group[start:start + step]
+                scores = self._score_profiles((subset, vocabularies), [unique[slot] for slot in chunk])
+                # Rank key: higher score first, then lower pet id; non-matches sort last
+                keys = np.where(scores >= min_score, (scores << _ID_BITS) | (_ID_MASK - ids), -1)
+                totals = (keys >= 0).sum(axis=1)
+                if keys.shape[1] > limit:
+                    keys = np.take_along_axis(keys, np.argpartition(-keys, limit - 1, axis=1)[:, :limit], axis=1)
+                keys = -np.sort(-keys, axis=1)
+                for slot, row, total in zip(chunk, keys, totals):
+                    page = [(int(_ID_MASK - (key & _ID_MASK)), int(key >> _ID_BITS)) for key in row if key >= 0]
+                    results[slot] = (page, int(total))
+        return [results[position] for position in positions]
+
+    def matches(self, preferences, min_score=50):
+        """Return [(pet_id, score), ...] at or above min_score, best first"""
+        ids, scores = self.score(preferences)
+        keep = scores >= min_score
+        ids, scores = ids[keep], scores[keep]
+        # Highest score first; ties keep pet id order like a stable sort would
+        order = np.lexsort((ids, -scores))
+        return [(int(ids[i]), int(scores[i])) for i in order]
+
+    def _match_keys(self, preferences, min_score):
+        """Packed rank keys of every match at or above min_score, unordered"""
+        ids, scores = self.score(preferences)
+        keep = scores >= min_score
+        ids, scores = ids[keep], scores[keep]
+        # Rank key: higher score first, then lower pet id
+        return (scores << _ID_BITS) | (_ID_MASK - ids)
+
+    def top_matches(self, preferences, limit, after=None, min_score=50):
+        """
+        Return one page of matches. `after` is a decoded cursor
+        (score, pet_id); only matches ranked after it are returned.
+        Returns (page, total, next_cursor) where page is
+        [(pet_id, score), ...] best first and total counts every match at
+        or above min_score. Rankings are cached per preference set, so
+        repeated queries and later pages cost a binary search; with the
+        cache disabled the page is picked by partial selection instead.
+        """
+        self._ensure_loaded()
+        after_key = None
+        if after is not None:
+            after_score, after_id = after
+            after_key = (after_score << _ID_BITS) | (_ID_MASK - after_id)
+
+        if self.results.max_entries > 0:
+            cache_key = preference_key(preferences, min_score)
+            version = self.version
+            keys = self.results.get(cache_key, version)
+            if keys is None:
+                keys = np.sort(self._match_keys(preferences, min_score))[::-1]
+                self.results.put(cache_key, version, keys)
+            total = len(keys)
+            start = 0
+            if after_key is not None:
+                # keys are descending, so search the negated (ascending) order
+                start = int(np.searchsorted(-keys, -after_key, side='right'))
+            selected = keys[start:start + limit]
+            has_more = start + limit < total
+        else:
+            keys = self._match_keys(preferences, min_score)
+            total = len(keys)
+            if after_key is not None:
+                keys = keys[keys < after_key]
+            has_more = len(keys) > limit
+            if has_more:
+                keys = keys[np.argpartition(-keys, limit - 1)[:limit]]
+            selected = np.sort(keys)[::-1]
+
+        page = [(int(_ID_MASK - (key & _ID_MASK)), int(key >> _ID_BITS)) for key in selected]
+        next_cursor = None
+        if has_more and page:
+            next_cursor = encode_cursor(page[-1][1], page[-1][0])
+        return page, total, next_cursor
+
+
+match_engine = MatchEngine(max_age=app.config.get('MATCH_SNAPSHOT_MAX_AGE', 300),
+                           cache_size=app.config.get('MATCH_CACHE_SIZE', 128),
+                           cache_ttl=app.config.get('MATCH_CACHE_TTL', 300))
+
+
+# Keep the snapshot in sync with committed Pet changes
+@event.listens_for(db.session, 'after_flush')
+def _collect_pet_changes(session, flush_context):
+    pending = session.info.setdefault('match_engine_pending', {})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Pet):
+            pending[obj.id] = pet_match_row(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Pet):
+            pending[obj.id] = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_pet_changes(session):
+    pending = session.info.pop('match_engine_pending', None)
+    if not pending:
+        return
+    for pet_id, row in pending.items():
+        if row is None:
+            match_engine.discard(pet_id)
+        else:
+            match_engine.apply(row)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pet_changes(session):
+    session.info.pop('match_engine_pending', None)
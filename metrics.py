@@ -0,0 +1,227 @@
+import hmac
+import threading
+import time
+from functools import wraps
+
+from flask import Response, abort, before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app
+
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the SQL statements per request histogram buckets
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count, as Prometheus histograms report them"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class RequestMetrics:
+    """
+    Per-endpoint request metrics for this worker process: latency and
+    SQL statement histograms, plus cumulative SQL and template time.
+    Each gunicorn worker keeps its own figures.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}  # (endpoint, method) -> dict of series
+
+    def _series(self, endpoint, method):
+        key = (endpoint, method)
+        series = self._endpoints.get(key)
+        if series is None:
+            series = self._endpoints[key] = {
+                'latency': Histogram(LATENCY_BUCKETS),
+                'statements': Histogram(STATEMENT_BUCKETS),
+                'sql_seconds': 0.0,
+                'template_seconds': 0.0,
+                'responses': {},  # status code -> count
+            }
+        return series
+
+    def record(self, endpoint, method, status, seconds, statements, sql_seconds, template_seconds):
+        with self._lock:
+            series = self._series(endpoint, method)
+            series['latency'].observe(seconds)
+            series['statements'].observe(statements)
+            series['sql_seconds'] += sql_seconds
+            series['template_seconds'] += template_seconds
+            series['responses'][status] = series['responses'].get(status, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+    def render(self):
+        """All series in the Prometheus text exposition format"""
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+            lines = []
+
+            def family(name, kind, help_text):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+
+            def histogram(name, attribute):
+                for (endpoint, method), series in endpoints:
+                    labels = f'endpoint="{endpoint}",method="{method}"'
+                    values = series[attribute]
+                    for bound, count in values.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {values.count}')
+                    lines.append(f'{name}_sum{{{labels}}} {round(values.sum, 6)}')
+                    lines.append(f'{name}_count{{{labels}}} {values.count}')
+
+            family('pet_http_request_duration_seconds', 'histogram', 'Request wall time by endpoint.')
+            histogram('pet_http_request_duration_seconds', 'latency')
+            family('pet_http_responses_total', 'counter', 'Responses by endpoint and status code.')
+            for (endpoint, method), series in endpoints:
+                for status, count in sorted(series['responses'].items()):
+                    lines.append(f'pet_http_responses_total{{endpoint="{endpoint}",method="{method}",'
+                                 f'status="{status}"}} {count}')
+            family('pet_db_statements_per_request', 'histogram', 'SQL statements run per request.')
+            histogram('pet_db_statements_per_request', 'statements')
+            family('pet_db_statement_seconds_total', 'counter', 'Time spent running SQL statements.')
+            for (endpoint, method), series in endpoints:
+                lines.append(f'pet_db_statement_seconds_total{{endpoint="{endpoint}",method="{method}"}} '
+                             f"{round(series['sql_seconds'], 6)}")
+            family('pet_template_render_seconds_total', 'counter', 'Time spent rendering templates.')
+            for (endpoint, method), series in endpoints:
+                lines.append(f'pet_template_render_seconds_total{{endpoint="{endpoint}",method="{method}"}} '
+                             f"{round(series['template_seconds'], 6)}")
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+def _request_stats():
+    """Counters of the request being served on this thread; None outside requests"""
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def _start_request():
+    g.request_stats = {'started': time.perf_counter(), 'statements': 0, 'sql_seconds': 0.0,
+                       'template_seconds': 0.0, 'template_depth': 0, 'template_started': 0.0}
+
+
+def _finish_request(response):
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return response
+    seconds = time.perf_counter() - stats['started']
+    endpoint = request.endpoint or 'unmatched'
+    request_metrics.record(endpoint, request.method, response.status_code, seconds, stats['statements'],
+                           stats['sql_seconds'], stats['template_seconds'])
+    if app.config.get('SERVER_TIMING'):
+        response.headers.add('Server-Timing', ', '.join([
+            f'app;dur={seconds * 1000:.1f}',
+            f"db;dur={stats['sql_seconds'] * 1000:.1f};desc=\"{stats['statements']} queries\"",
+            f"tpl;dur={stats['template_seconds'] * 1000:.1f}",
+        ]))
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _request_stats()
+    if stats is not None:
+        # Keyed by execution, so a failed statement's entry can be dropped on its own
+        conn.info.setdefault('metrics_started', {})[context] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started', {}).pop(context, None)
+    stats = _request_stats()
+    if stats is not None and started is not None:
+        stats['sql_seconds'] += time.perf_counter() - started
+        stats['statements'] += 1
+
+
+def _handle_error(exception_context):
+    # A failed statement gets no after_cursor_execute; don't keep its start time on the pooled connection
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None:
+        conn.info.get('metrics_started', {}).pop(exception_context.execution_context, None)
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        # Only the outermost render is timed; nested renders are part of it
+        if stats['template_depth'] == 0:
+            stats['template_started'] = time.perf_counter()
+        stats['template_depth'] += 1
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and stats['template_depth']:
+        stats['template_depth'] -= 1
+        if stats['template_depth'] == 0:
+            stats['template_seconds'] += time.perf_counter() - stats['template_started']
+
+
+# Nothing is hooked in unless metrics are enabled, so disabled metrics cost nothing per request
+if app.config.get('METRICS_ENABLED'):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(Engine, 'handle_error', _handle_error)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+
+def token_required(view):
+    """
+    Only serve `view` to requests sent with `Authorization: Bearer <METRICS_TOKEN>`;
+    a 404 for everyone else, and for every request while no token is configured.
+    """
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        token = app.config.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        # Constant-time and on bytes, as for the sampling profiler's token
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(supplied.encode(), token.encode()):
+            abort(404)
+        return view(*args, **kwargs)
+    return guarded
+
+
+@app.route('/metrics')
+@token_required
+def prometheus_metrics():
+    if not app.config.get('METRICS_ENABLED'):
+        abort(404)
+    return Response(request_metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
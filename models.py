@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import inspect, text
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -16,6 +17,9 @@ class User(UserMixin, db.Model):
     state = db.Column(db.String(100))
     zip_code = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Cached SUM(CartItem.quantity) for this user, kept current by cart.refresh_cart_count
+    # (None means unknown and is recomputed on read)
+    cart_count = db.Column(db.Integer, default=0)
     
     # Relationships
     pets = db.relationship('Pet', backref='owner', lazy=True)
@@ -44,7 +48,9 @@ class Pet(db.Model):
     behavior_info = db.Column(db.Text)
     adoption_status = db.Column(db.String(20), default='available')  # available, pending, adopted
     image_filename = db.Column(db.String(255))
+    image_variants = db.Column(db.String(100))  # comma-separated, see images.RENDITION_VERSIONS
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Pet matching attributes
     size = db.Column(db.String(20))  # small, medium, large
@@ -57,6 +63,19 @@ class Pet(db.Model):
     # Foreign keys
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     
+    __table_args__ = (
+        # Available pets, newest first (home page, listing, matching)
+        db.Index('ix_pet_status_created', 'adoption_status', 'created_at'),
+        # Listing filtered by species
+        db.Index('ix_pet_status_species_created', 'adoption_status', 'species', 'created_at'),
+        # An owner's other pets (pet detail, profile)
+        db.Index('ix_pet_user_status', 'user_id', 'adoption_status'),
+        # Latest change among an owner's pets, for the pet detail watermark
+        db.Index('ix_pet_user_updated', 'user_id', 'updated_at'),
+        # Latest change, for conditional GET watermarks
+        db.Index('ix_pet_updated', 'updated_at'),
+    )
+    
     def __repr__(self):
         return f'<Pet {self.name}, {self.species}>'
 
@@ -70,10 +89,18 @@ class Product(db.Model):
     stock = db.Column(db.Integer, default=0)
     image_filename = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
     
+    __table_args__ = (
+        # Category filter and related products
+        db.Index('ix_product_category', 'category'),
+        # Latest change, for conditional GET watermarks
+        db.Index('ix_product_updated', 'updated_at'),
+    )
+    
     def __repr__(self):
         return f'<Product {self.name}, ${self.price}>'
 
@@ -112,6 +139,13 @@ class Donation(db.Model):
     donation_date = db.Column(db.DateTime, default=datetime.utcnow)
     is_anonymous = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        # Public donation feed, most recent first
+        db.Index('ix_donation_anonymous_date', 'is_anonymous', 'donation_date'),
+        # A user's donations (profile)
+        db.Index('ix_donation_user_date', 'user_id', 'donation_date'),
+    )
+    
     def __repr__(self):
         return f'<Donation ${self.amount}, User {self.user_id}>'
 
@@ -127,5 +161,149 @@ class CartItem(db.Model):
     user = db.relationship('User', backref=db.backref('cart_items', lazy=True, cascade='all, delete-orphan'))
     product = db.relationship('Product', backref=db.backref('cart_items', lazy=True))
     
+    __table_args__ = (
+        # A user's cart; includes quantity so cart counts are answered from the index alone
+        db.Index('ix_cart_item_user_product', 'user_id', 'product_id', 'quantity'),
+    )
+    
     def __repr__(self):
         return f'<CartItem User {self.user_id}, Product {self.product_id}, Qty {self.quantity}>'
+
+
+class MatchProfile(db.Model):
+    """An applicant's saved pet match preferences, used to find applicants for new pets"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
+    species = db.Column(db.String(50), nullable=False)
+    age_preference = db.Column(db.String(20), default='any')
+    gender_preference = db.Column(db.String(20), default='any')
+    size_preference = db.Column(db.String(20), default='any')
+    energy_level = db.Column(db.String(20), default='any')
+    good_with_children = db.Column(db.Boolean, default=False)
+    good_with_other_pets = db.Column(db.Boolean, default=False)
+    special_needs = db.Column(db.Boolean, default=False)
+    living_environment = db.Column(db.String(30))
+    time_availability = db.Column(db.String(30))
+    training_preference = db.Column(db.String(30))
+    active = db.Column(db.Boolean, default=True, nullable=False)  # wants to hear about new pets
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationships
+    user = db.relationship('User', backref=db.backref('match_profile', uselist=False))
+
+    __table_args__ = (
+        # Active applicants by species (reverse matching)
+        db.Index('ix_match_profile_active_species', 'active', 'species'),
+    )
+
+    PREFERENCE_FIELDS = ('species', 'age_preference', 'gender_preference', 'size_preference',
+                         'energy_level', 'good_with_children', 'good_with_other_pets', 'special_needs',
+                         'living_environment', 'time_availability', 'training_preference')
+
+    def preferences(self):
+        """The profile as a preference dict, in the format the pet match form produces"""
+        return {field: getattr(self, field) for field in self.PREFERENCE_FIELDS}
+
+    def __repr__(self):
+        return f'<MatchProfile User {self.user_id}, {self.species}>'
+
+
+
+class UploadBlob(db.Model):
+    """A content-addressed upload, shared by every record that references the same bytes"""
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # sha256 hex of the contents
+    filename = db.Column(db.String(255), nullable=False)  # path relative to UPLOAD_FOLDER
+    size = db.Column(db.Integer)
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UploadBlob {self.filename}, refs {self.refcount}>'
+
+
+class Job(db.Model):
+    """A unit of background work, run by the worker pool in jobs.py"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)  # registered task name
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # not before, for retry backoff
+    locked_at = db.Column(db.DateTime)  # when a worker claimed it
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Next runnable job, and stale running jobs
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}, {self.status}>'
+
+
+class TableVersion(db.Model):
+    """Rows deleted from a table so far; deletes leave max(updated_at) alone, so watermarks count them here"""
+    table_name = db.Column(db.String(50), primary_key=True)
+    deletes = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}, {self.deletes} deletes>'
+
+
+# Backfill statements run once, right after a column is added to an existing table
+COLUMN_BACKFILLS = {
+    ('user', 'cart_count'): 'UPDATE "user" SET cart_count = '
+                            '(SELECT COALESCE(SUM(quantity), 0) FROM cart_item WHERE cart_item.user_id = "user".id)',
+    ('pet', 'updated_at'): 'UPDATE pet SET updated_at = created_at',
+    ('product', 'updated_at'): 'UPDATE product SET updated_at = created_at',
+}
+
+
+def upgrade_schema():
+    """
+    Add columns and indexes missing from an existing database.
+    db.create_all() only creates new tables, so this brings databases
+    created by older versions (e.g. instance/pet_adoption.db) up to date.
+    Safe to run on every start.
+    """
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        preparer = connection.dialect.identifier_preparer
+        for model_table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(model_table.name)}
+            for column in model_table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                connection.execute(text(f'ALTER TABLE {preparer.format_table(model_table)} '
+                                        f'ADD COLUMN {preparer.format_column(column)} {column_type}'))
+                backfill = COLUMN_BACKFILLS.get((model_table.name, column.name))
+                if backfill:
+                    connection.execute(text(backfill))
+            for index in model_table.indexes:
+                index.create(bind=connection, checkfirst=True)
+
+
+def check_schema():
+    """
+    Raise RuntimeError if the database lacks tables or columns of the models,
+    i.e. `flask init-db` hasn't created or upgraded it since the last deploy.
+    Only reads the catalogue, so it is cheap enough for every worker start.
+    """
+    # Every table's columns at once (a single query on Postgres)
+    tables = {table: {c['name'] for c in columns}
+              for (_, table), columns in inspect(db.engine).get_multi_columns().items()}
+    missing = []
+    for model_table in db.metadata.sorted_tables:
+        if model_table.name not in tables:
+            missing.append(model_table.name)
+            continue
+        missing.extend(f'{model_table.name}.{column.name}' for column in model_table.columns
+                       if column.name not in tables[model_table.name])
+    if missing:
+        raise RuntimeError(f"Database schema is out of date (missing {', '.join(missing)}); "
+                           f"run `flask init-db` before starting the app")
@@ -0,0 +1,135 @@
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+# Seconds a listing's total row count is reused before being counted again
+COUNT_CACHE_TTL = 60
+# Listings whose counts are kept at once; the least recently used go first
+COUNT_CACHE_SIZE = 256
+
+_counts = OrderedDict()  # count key -> (expires_at, total), oldest use first
+_counts_lock = threading.Lock()
+
+
+def cached_count(key, query):
+    """Total rows for a filtered listing, counted at most once per COUNT_CACHE_TTL"""
+    now = time.monotonic()
+    with _counts_lock:
+        cached = _counts.get(key)
+        if cached and cached[0] > now:
+            _counts.move_to_end(key)
+            return cached[1]
+    total = query.order_by(None).count()
+    with _counts_lock:
+        _counts[key] = (now + COUNT_CACHE_TTL, total)
+        _counts.move_to_end(key)
+        if len(_counts) > COUNT_CACHE_SIZE:
+            # Expired counts go first, then the least recently used
+            for expired in [k for k, (expires_at, _) in _counts.items() if expires_at <= now]:
+                del _counts[expired]
+        while len(_counts) > COUNT_CACHE_SIZE:
+            _counts.popitem(last=False)
+    return total
+
+
+def _encode_value(value):
+    return {'dt': value.isoformat()} if isinstance(value, datetime) else value
+
+
+def _decode_value(value):
+    return datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+
+
+def encode_cursor(direction, values):
+    """Opaque cursor for the page after ('next') or before ('prev') a row's sort key"""
+    raw = json.dumps([direction, [_encode_value(value) for value in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Inverse of encode_cursor; returns None for a missing or malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        direction, values = json.loads(raw)
+        if direction not in ('next', 'prev') or len(values) != size:
+            return None
+        return direction, [_decode_value(value) for value in values]
+    except (ValueError, TypeError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing, with cursors to its neighbours"""
+
+    def __init__(self, items, per_page, next_cursor, prev_cursor, total=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.per_page))
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, columns, cursor, per_page, descending=True, total=None):
+    """
+    Seek-paginate a query ordered by `columns` (the last one must be unique,
+    e.g. the primary key). Each page is a range scan starting at the
+    cursor's sort key, so deep pages cost the same as the first and no
+    COUNT(*) is needed.
+    """
+    decoded = decode_cursor(cursor, len(columns))
+    direction, values = decoded if decoded else ('next', None)
+    # Walking backwards scans in the opposite order and flips the page afterwards
+    forward = direction == 'next'
+    scan_descending = descending == forward
+
+    key = tuple_(*columns)
+    if values is not None:
+        bound = tuple_(*values)
+        query = query.filter(key < bound if scan_descending else key > bound)
+    query = query.order_by(*[column.desc() if scan_descending else column.asc() for column in columns])
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    def sort_key(row):
+        return [getattr(row, column.key) for column in columns]
+
+    # A cursor means there is a page on the side we came from; the extra row
+    # fetched above tells whether there is one on the side we are heading to
+    if forward:
+        more_after, more_before = has_more, values is not None
+    else:
+        more_after, more_before = True, has_more
+
+    next_cursor = prev_cursor = None
+    if rows and more_after:
+        next_cursor = encode_cursor('next', sort_key(rows[-1]))
+    if rows and more_before:
+        prev_cursor = encode_cursor('prev', sort_key(rows[0]))
+    return KeysetPage(rows, per_page, next_cursor, prev_cursor, total)
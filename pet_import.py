@@ -0,0 +1,344 @@
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import click
+from wtforms import IntegerField
+from wtforms.validators import DataRequired, Length, NumberRange, Optional
+
+from app import app, db
+from forms import PetRegistrationForm
+from models import Pet
+from routes import add_pet_matching_attributes
+
+
+# Columns read from an import file; the same fields as the add pet form
+IMPORT_FIELDS = ('name', 'species', 'breed', 'age', 'gender', 'description', 'health_info', 'behavior_info')
+# Attributes filled in by add_pet_matching_attributes
+DERIVED_FIELDS = ('size', 'energy_level', 'good_with_children', 'good_with_other_pets',
+                  'special_needs', 'training_level')
+
+DEFAULT_BATCH_SIZE = 5000
+# Derived attributes are remembered per (species, breed, age); cleared past this many entries
+DERIVED_CACHE_SIZE = 200000
+JSON_CHUNK_SIZE = 1 << 16
+# Characters of a malformed JSON element kept for the rejects file
+REJECT_TEXT_LIMIT = 1000
+
+
+class RowError(ValueError):
+    """A row that doesn't pass the add pet form's validation"""
+
+
+class UnreadableRow(RowError):
+    """Yielded by a reader in place of a row it couldn't parse; `data` is the raw input"""
+
+    def __init__(self, message, data):
+        super().__init__(message)
+        self.data = data
+
+
+class _FieldRule:
+    """The validation rules of one PetRegistrationForm field, read from its definition"""
+
+    def __init__(self, name, unbound_field):
+        self.name = name
+        validators = unbound_field.kwargs.get('validators') or []
+        self.required = any(isinstance(v, DataRequired) for v in validators)
+        self.optional = any(isinstance(v, Optional) for v in validators)
+        self.integer = issubclass(unbound_field.field_class, IntegerField)
+        choices = unbound_field.kwargs.get('choices')
+        self.choices = {value for value, _ in choices} if choices else None
+        self.max_length = None
+        self.min_value = self.max_value = None
+        for validator in validators:
+            if isinstance(validator, Length) and validator.max != -1:
+                self.max_length = validator.max
+            elif isinstance(validator, NumberRange):
+                self.min_value, self.max_value = validator.min, validator.max
+
+    def clean(self, value):
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            if self.required or (self.choices is not None and not self.optional):
+                raise RowError(f'{self.name}: This field is required.')
+            return None
+        if self.integer:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise RowError(f'{self.name}: Not a valid integer value.')
+            if self.min_value is not None and value < self.min_value:
+                raise RowError(f'{self.name}: Number must be at least {self.min_value}.')
+            if self.max_value is not None and value > self.max_value:
+                raise RowError(f'{self.name}: Number must be at most {self.max_value}.')
+            return value
+        value = str(value)
+        if self.choices is not None:
+            value = value.lower()
+            if value not in self.choices:
+                raise RowError(f'{self.name}: Not a valid choice.')
+        if self.max_length is not None and len(value) > self.max_length:
+            raise RowError(f'{self.name}: Field cannot be longer than {self.max_length} characters.')
+        return value
+
+
+def form_rules():
+    """Validation rules for the imported fields, taken from PetRegistrationForm"""
+    return [_FieldRule(name, getattr(PetRegistrationForm, name)) for name in IMPORT_FIELDS]
+
+
+def clean_row(rules, row):
+    """Validate and convert one raw row; raises RowError listing every problem"""
+    if not isinstance(row, dict):
+        raise RowError('Row is not an object')
+    values = {}
+    errors = []
+    for rule in rules:
+        try:
+            values[rule.name] = rule.clean(row.get(rule.name))
+        except RowError as e:
+            errors.append(str(e))
+    if errors:
+        raise RowError('; '.join(errors))
+    return values
+
+
+class MatchingAttributes:
+    """
+    add_pet_matching_attributes for many rows. Its result only depends on
+    species, breed and age, which repeat heavily in shelter feeds, so each
+    distinct combination is derived once and reused.
+    """
+
+    def __init__(self, max_entries=DERIVED_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._derived = {}
+
+    def derive(self, species, breed, age):
+        key = (species, breed, age)
+        derived = self._derived.get(key)
+        if derived is None:
+            # Starts from the column defaults of a new Pet
+            pet = SimpleNamespace(species=species, breed=breed, age=age, size=None, energy_level=None,
+                                  good_with_children=False, good_with_other_pets=False,
+                                  special_needs=False, training_level=None)
+            add_pet_matching_attributes(pet)
+            derived = tuple(getattr(pet, field) for field in DERIVED_FIELDS)
+            if len(self._derived) >= self.max_entries:
+                self._derived.clear()
+            self._derived[key] = derived
+        return derived
+
+    def apply(self, rows):
+        for row in rows:
+            row.update(zip(DERIVED_FIELDS, self.derive(row['species'], row['breed'], row['age'])))
+        return rows
+
+
+def read_csv(stream):
+    yield from csv.DictReader(stream)
+
+
+def read_ndjson(stream):
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            # One corrupt line is a reject, not the end of the import
+            yield UnreadableRow(f'Line {line_number}: invalid JSON ({e.msg} at column {e.colno})', line)
+
+
+def read_json_array(stream, chunk_size=JSON_CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    number = 0
+    while True:
+        # Skip whitespace and separators, reading more input as needed
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                if started:
+                    raise ValueError('Unterminated JSON array')
+                return
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not started:
+            if buffer[position] != '[':
+                raise ValueError('Expected a JSON array')
+            started = True
+            position += 1
+            continue
+        if buffer[position] == ']':
+            return
+        try:
+            element, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            # Running into the end of the buffer (an unterminated string is reported
+            # where it starts) means the element continues in the next chunk
+            if e.pos >= len(buffer) or e.msg.startswith('Unterminated string'):
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+            # A malformed element is a reject, not the end of the import
+            buffer, position, text = _skip_element(stream, buffer, position, chunk_size)
+            number += 1
+            yield UnreadableRow(f'Element {number}: invalid JSON ({e.msg})', text)
+            continue
+        number += 1
+        yield element
+        position = end
+
+
+def _skip_element(stream, buffer, position, chunk_size):
+    """
+    Move past a malformed array element to the next top-level ',' or ']',
+    following strings and nesting and reading more input as needed. Only
+    the first REJECT_TEXT_LIMIT characters of the element are kept.
+    Returns (buffer, position of the separator, element text).
+    """
+    text = ''
+    start = position
+    depth = 0
+    in_string = escaped = False
+    while True:
+        while position < len(buffer):
+            char = buffer[position]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '[{':
+                depth += 1
+            elif char in ']}' and depth:
+                depth -= 1
+            elif char in ',]' and not depth:
+                text += buffer[start:position]
+                return buffer, position, text[:REJECT_TEXT_LIMIT].strip()
+            position += 1
+        text = (text + buffer[start:])[:REJECT_TEXT_LIMIT]
+        buffer = stream.read(chunk_size)
+        if not buffer:
+            raise ValueError('Unterminated JSON array')
+        start = position = 0
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+    'json': read_json_array,
+}
+EXTENSIONS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json'}
+
+
+def import_pets(stream, file_format, batch_size=DEFAULT_BATCH_SIZE, owner_id=None, on_reject=None,
+                on_progress=None):
+    """
+    Validate, enrich and insert every pet in an import stream. Rows are
+    written with one executemany INSERT and one transaction per batch, so
+    a bad row costs a reject, not the rest of the file. If the feed itself
+    breaks off (e.g. a truncated JSON array), the rows validated so far
+    are written before the error propagates. Returns (imported, rejected).
+    """
+    rules = form_rules()
+    attributes = MatchingAttributes()
+    imported = rejected = 0
+    batch = []
+
+    def flush():
+        nonlocal imported
+        # Taken off the batch first, so a failed insert is never retried
+        rows = batch[:]
+        batch.clear()
+        now = datetime.utcnow()
+        for row in attributes.apply(rows):
+            row.update(adoption_status='available', user_id=owner_id, created_at=now, updated_at=now)
+        # A Core insert on the table: the ORM's bulk path splits rows by which values are None
+        db.session.execute(Pet.__table__.insert(), rows)
+        db.session.commit()
+        imported += len(rows)
+        if on_progress:
+            on_progress(imported, rejected)
+
+    try:
+        for number, row in enumerate(READERS[file_format](stream), start=1):
+            try:
+                if isinstance(row, UnreadableRow):
+                    raise row
+                batch.append(clean_row(rules, row))
+            except RowError as e:
+                rejected += 1
+                if on_reject:
+                    on_reject(number, e.data if isinstance(e, UnreadableRow) else row, str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush()
+    finally:
+        if batch:
+            flush()
+    return imported, rejected
+
+
+@app.cli.command('import-pets')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(sorted(READERS)),
+              help='File format (default: from the file extension).')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows per INSERT and transaction.')
+@click.option('--owner-id', type=int,
+              help='User listing the pets (default: no owner; pet pages then show the shelter).')
+@click.option('--rejects', type=click.Path(dir_okay=False, writable=True),
+              help='Write rejected rows and their errors to this CSV file.')
+def import_pets_command(path, file_format, batch_size, owner_id, rejects):
+    """Bulk import pets from a CSV, JSON array or NDJSON shelter feed."""
+    file_format = file_format or EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if file_format is None:
+        raise click.UsageError('Unknown file extension, pass --format')
+
+    started = time.perf_counter()
+    reject_file = open(rejects, 'w', newline='', encoding='utf-8') if rejects else None
+    reject_writer = csv.writer(reject_file) if reject_file else None
+    if reject_writer:
+        reject_writer.writerow(['row', 'error', 'data'])
+
+    def on_reject(number, row, error):
+        if reject_writer:
+            reject_writer.writerow([number, error, json.dumps(row, default=str)])
+        elif number <= 1000:
+            click.echo(f'Row {number} rejected: {error}', err=True)
+
+    def on_progress(imported, rejected):
+        elapsed = time.perf_counter() - started
+        click.echo(f'{imported} imported, {rejected} rejected, {imported / elapsed:.0f} rows/s')
+
+    try:
+        with open(path, newline='', encoding='utf-8') as stream:
+            imported, rejected = import_pets(stream, file_format, batch_size=batch_size, owner_id=owner_id,
+                                             on_reject=on_reject, on_progress=on_progress)
+    finally:
+        if reject_file:
+            reject_file.close()
+
+    elapsed = time.perf_counter() - started
+    click.echo(f'Imported {imported} pets in {elapsed:.1f}s ({imported / elapsed if elapsed else 0:.0f} rows/s), '
+               f'{rejected} rejected')
@@ -0,0 +1,217 @@
+import json
+import os
+import random
+import re
+import time
+import traceback
+import uuid
+from datetime import datetime
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import app, db
+
+
+# Statements that can be explained without side effects
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|WITH)\b', re.IGNORECASE)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_REPEATED_ROWS = re.compile(r'(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+# Application frames shown as the origin of a statement
+ORIGIN_FRAMES = 3
+
+
+def statement_shape(statement):
+    """
+    Normalise a statement so executions that differ only in their values
+    (literals, the length of IN lists, multi-row VALUES) share one shape.
+    """
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?...)', shape)
+    shape = _REPEATED_ROWS.sub(r'\1', shape)
+    return _WHITESPACE.sub(' ', shape).strip()
+
+
+def _origin():
+    """The innermost application frames (not the ORM's) that issued a statement"""
+    frames = [frame for frame in traceback.extract_stack()[:-3]
+              if frame.filename.startswith(app.root_path) and 'site-packages' not in frame.filename
+              and os.path.basename(frame.filename) != 'query_profiler.py']
+    return [f'{os.path.relpath(frame.filename, app.root_path)}:{frame.lineno} in {frame.name}'
+            for frame in frames[-ORIGIN_FRAMES:]]
+
+
+class QueryProfile:
+    """The statements run while serving one request, grouped by shape"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.shapes = {}  # shape -> dict of statistics and a sample execution
+
+    def record(self, statement, parameters, executemany, seconds):
+        self.statements += 1
+        self.sql_seconds += seconds
+        shape = statement_shape(statement)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = {
+                'shape': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'origin': _origin(),
+                'statement': statement, 'parameters': parameters, 'executemany': executemany,
+            }
+        entry['count'] += 1
+        entry['total_ms'] += seconds * 1000
+        if seconds * 1000 >= entry['max_ms']:
+            # Keep the slowest execution as the one to explain
+            entry['max_ms'] = seconds * 1000
+            entry['statement'], entry['parameters'], entry['executemany'] = statement, parameters, executemany
+
+    def problems(self, slow_ms, repeat_threshold):
+        """Shapes run too many times in one request (N+1) or slower than slow_ms"""
+        flagged = []
+        for entry in self.shapes.values():
+            flags = []
+            if entry['count'] >= repeat_threshold and _EXPLAINABLE.match(entry['statement']):
+                flags.append('repeated')
+            if entry['max_ms'] >= slow_ms:
+                flags.append('slow')
+            if flags:
+                flagged.append((entry, flags))
+        return flagged
+
+
+def explain(statement, parameters, analyze=False):
+    """
+    The plan of one statement as text lines, or None if it can't be
+    explained. Runs on a raw DBAPI connection, so the EXPLAIN doesn't show
+    up in the request's own statistics; ANALYZE runs the statement for
+    real (Postgres only) inside a transaction that is rolled back.
+    """
+    if not _EXPLAINABLE.match(statement):
+        return None
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    elif dialect == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    else:
+        return None
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters or ())
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        connection.rollback()
+    except Exception as e:
+        connection.rollback()
+        return [f'EXPLAIN failed: {str(e)}']
+    finally:
+        connection.close()
+    if dialect == 'sqlite':
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def write_report(profile, status):
+    """Write a JSON report of a profiled request; returns its path"""
+    slow_ms = app.config.get('SLOW_QUERY_MS', 100)
+    repeat_threshold = app.config.get('QUERY_REPEAT_THRESHOLD', 5)
+    analyze = app.config.get('QUERY_EXPLAIN_ANALYZE', False)
+    flagged = profile.problems(slow_ms, repeat_threshold)
+    flagged_shapes = {entry['shape']: flags for entry, flags in flagged}
+
+    shapes = []
+    for entry in sorted(profile.shapes.values(), key=lambda entry: entry['total_ms'], reverse=True):
+        report_entry = {
+            'shape': entry['shape'],
+            'count': entry['count'],
+            'total_ms': round(entry['total_ms'], 3),
+            'max_ms': round(entry['max_ms'], 3),
+            'origin': entry['origin'],
+        }
+        flags = flagged_shapes.get(entry['shape'])
+        if flags:
+            report_entry['flags'] = flags
+            if not entry['executemany']:
+                report_entry['plan'] = explain(entry['statement'], entry['parameters'], analyze)
+        shapes.append(report_entry)
+
+    now = datetime.utcnow()
+    report = {
+        'time': now.isoformat(),
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': status,
+        'duration_ms': round((time.perf_counter() - profile.started) * 1000, 3),
+        'statements': profile.statements,
+        'sql_ms': round(profile.sql_seconds * 1000, 3),
+        'flagged': len(flagged),
+        'shapes': shapes,
+    }
+    folder = app.config['QUERY_REPORT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{now:%Y%m%d-%H%M%S}-{request.endpoint or 'unmatched'}-{uuid.uuid4().hex[:8]}.json")
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2, default=str)
+
+    for entry, flags in flagged:
+        app.logger.warning(f"{' and '.join(flags).capitalize()} query in {request.endpoint}: "
+                           f"{entry['count']}x, max {entry['max_ms']:.1f} ms, from "
+                           f"{entry['origin'][-1] if entry['origin'] else 'unknown'}: {entry['shape'][:200]}")
+    return path
+
+
+def _current_profile():
+    if not has_request_context():
+        return None
+    return g.get('query_profile')
+
+
+def _start_profile():
+    if request.endpoint == 'static':
+        return
+    if random.random() < app.config.get('QUERY_PROFILE_SAMPLE_RATE', 0):
+        g.query_profile = QueryProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop('query_profile', None)
+    if profile is not None:
+        try:
+            path = write_report(profile, response.status_code)
+            app.logger.debug(f'Query report written to {path}')
+        except Exception as e:
+            app.logger.error(f'Error writing query report: {str(e)}')
+    return response
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault('query_profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    if profile is not None and conn.info.get('query_profile_started'):
+        seconds = time.perf_counter() - conn.info['query_profile_started'].pop()
+        profile.record(statement, parameters, executemany, seconds)
+
+
+# Only hooked in when some requests are sampled
+if app.config.get('QUERY_PROFILE_SAMPLE_RATE', 0) > 0:
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
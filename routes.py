@@ -2,36 +2,72 @@ import os
 import logging
 import json
 import shutil
-import requests
 import math
 from datetime import datetime
+import click
 from flask import render_template, redirect, url_for, flash, request, abort, session, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.utils import secure_filename
+from sqlalchemy.orm import joinedload
 from app import app, db
-from models import User, Pet, Product, Order, OrderItem, Donation, CartItem
-from forms import (LoginForm, RegistrationForm, PetRegistrationForm, 
+from models import User, Pet, Product, Donation, CartItem, upgrade_schema
+from forms import (LoginForm, RegistrationForm, PetRegistrationForm, DeletePetForm,
                  DonationForm, ProfileUpdateForm, SearchForm, PetMatchForm)
-import uuid
+from matching import match_engine, decode_cursor
+from search import filter_pets_by_text, ensure_search_index
+from images import queue_pet_image
+from fragments import fragment_cache, FEATURED_PETS, DONATION_FRAGMENTS, DONATION_TABLE, HOME_DONATIONS
+from storage import store_upload, release_upload, remove_files
+from conditional import conditional_get, table_watermark
+from pagination import keyset_paginate, cached_count
+from applicants import applicant_index, save_match_profile
+from jobs import enqueue, after_commit, queue_stats
+from metrics import token_required
+from catalogue import (stream_catalogue, select_fields, FORMATS, PET_FIELDS, DEFAULT_PET_FIELDS,
+                       PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+from cart import (get_cart_count, refresh_cart_count, load_cart, cart_totals,
+                  place_order, InsufficientStock)
+
+
+# Match results per page (HTML and default API page size)
+MATCH_PAGE_SIZE = 12
+MAX_API_MATCH_LIMIT = 100
+# Preference profiles accepted by one batch match request; scoring is CPU-bound,
+# so callers who aren't signed in get far fewer
+MAX_BATCH_MATCH_PROFILES = 10000
+MAX_ANONYMOUS_BATCH_MATCH_PROFILES = 20
+# Ids bound per IN (...) lookup, well under SQLite's bound-variable limit
+ID_LOOKUP_CHUNK = 1000
+MAX_API_APPLICANT_LIMIT = 100
 
 
 # Context processor to make cart count available in all templates
+# (read from the counter cached on the already-loaded user row)
 @app.context_processor
 def inject_cart_count():
     cart_count = 0
     if current_user.is_authenticated:
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-        cart_count = sum(item.quantity for item in cart_items)
+        cart_count = get_cart_count(current_user)
     return dict(cart_count=cart_count)
 
 
 @app.route('/')
 def index():
-    # Get featured pets (newest 4 pets)
-    featured_pets = Pet.query.filter_by(adoption_status='available').order_by(Pet.created_at.desc()).limit(4).all()
-    # Get recent donations (only show non-anonymous)
-    recent_donations = Donation.query.filter_by(is_anonymous=False).order_by(Donation.donation_date.desc()).limit(3).all()
-    return render_template('index.html', featured_pets=featured_pets, recent_donations=recent_donations)
+    # Featured pets (newest 4 pets), rendered once and cached until a pet changes
+    featured_pets_html = fragment_cache.render(FEATURED_PETS, lambda: render_template(
+        'fragments/featured_pets.html',
+        featured_pets=Pet.query.filter_by(adoption_status='available').order_by(Pet.created_at.desc()).limit(4).all()))
+    # Recent donations (only show non-anonymous), cached until the next donation
+    recent_donations_html = fragment_cache.render(HOME_DONATIONS, lambda: render_template(
+        'fragments/home_donations.html', recent_donations=recent_public_donations(3)))
+    return render_template('index.html', featured_pets_html=featured_pets_html,
+                           recent_donations_html=recent_donations_html)
+
+
+def recent_public_donations(limit):
+    return (Donation.query.options(joinedload(Donation.donor))
+            .filter_by(is_anonymous=False)
+            .order_by(Donation.donation_date.desc())
+            .limit(limit).all())
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -106,28 +142,50 @@ def pet_listing():
     page = request.args.get('page', 1, type=int)
     per_page = 12  # Number of pets per page
     
+    # Nothing to do if no pet has changed since the client's copy
+    pets_latest, pets_deletes = table_watermark(Pet)
+    not_modified = conditional_get(pets_latest, pets_deletes)
+    if not_modified:
+        return not_modified
+    
     # Base query
     query = Pet.query.filter_by(adoption_status='available')
     
-    # Apply filters if provided
+    # Apply filters if provided (full-text search ranks the best matches first)
     if form.query.data:
-        search_term = f"%{form.query.data}%"
-        query = query.filter((Pet.name.like(search_term)) | 
-                            (Pet.breed.like(search_term)) | 
-                            (Pet.description.like(search_term)))
+        query = filter_pets_by_text(query, form.query.data)
     
     if form.species.data:
-        query = query.filter_by(species=form.species.data)
+        query = query.filter(Pet.species == form.species.data)
     
-    # Get paginated results
-    pets = query.order_by(Pet.created_at.desc()).paginate(page=page, per_page=per_page)
+    # Search results are ranked, and old ?page= links keep working with
+    # offset pagination; plain browsing seeks by (created_at, id) instead
+    keyset = not form.query.data and 'page' not in request.args
+    if keyset:
+        pets = keyset_paginate(query, [Pet.created_at, Pet.id], request.args.get('cursor'), per_page)
+    else:
+        pets = query.order_by(Pet.created_at.desc()).paginate(page=page, per_page=per_page)
     
-    return render_template('pet_listing.html', pets=pets, form=form)
+    return render_template('pet_listing.html', pets=pets, form=form, keyset=keyset)
 
 
 @app.route('/pets/<int:pet_id>')
 def pet_detail(pet_id):
-    pet = Pet.query.get_or_404(pet_id)
+    pet = Pet.query.options(joinedload(Pet.owner)).filter_by(id=pet_id).first_or_404()
+    viewed_by_owner = current_user.is_authenticated and current_user.id == pet.user_id
+    
+    # The page shows the pet, its owner and the owner's other available pets
+    # (status changes bump updated_at, so watching all the owner's pets covers them).
+    # The owner's copy carries the delete form's CSRF token, so it is always rendered
+    if not viewed_by_owner:
+        others_latest, others_deletes = None, 0
+        if pet.owner:
+            others_latest, others_deletes = table_watermark(Pet, Pet.user_id == pet.user_id)
+        not_modified = conditional_get(pet.updated_at, pet.owner and pet.owner.username, others_latest,
+                                       others_deletes)
+        if not_modified:
+            return not_modified
+    
     # Get other pets from the same owner
     other_pets = []
     if pet.owner:
@@ -135,7 +193,10 @@ def pet_detail(pet_id):
                                      Pet.id != pet.id, 
                                      Pet.adoption_status == 'available').limit(4).all()
     
-    return render_template('pet_detail.html', pet=pet, other_pets=other_pets)
+    # Owners can take their listing down
+    delete_form = DeletePetForm() if viewed_by_owner else None
+    
+    return render_template('pet_detail.html', pet=pet, other_pets=other_pets, delete_form=delete_form)
 
 
 @app.route('/add_pet', methods=['GET', 'POST'])
@@ -147,15 +208,9 @@ def add_pet():
         # Handle image upload
         image_filename = None
         if form.image.data:
-            # Generate a unique filename
-            filename = secure_filename(form.image.data.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            
-            # Save the file
+            # Save the file into the content-addressed store (identical photos are kept once)
             try:
-                form.image.data.save(file_path)
-                image_filename = unique_filename
+                image_filename = store_upload(form.image.data)
             except Exception as e:
                 app.logger.error(f"Error saving image: {str(e)}")
                 flash('Error uploading image. Please try again.', 'danger')
@@ -176,6 +231,13 @@ def add_pet():
         )
         
         db.session.add(pet)
+        db.session.flush()
+        
+        # Resizing the photo and telling the best-matching applicants happen in the
+        # background; the jobs are committed together with the pet
+        queue_pet_image(pet)
+        enqueue('notify_matching_applicants', pet_id=pet.id)
+        after_commit(lambda: fragment_cache.invalidate(FEATURED_PETS))
         db.session.commit()
         
         flash('Pet successfully registered for adoption!', 'success')
@@ -184,12 +246,43 @@ def add_pet():
     return render_template('add_pet.html', form=form)
 
 
+@app.route('/pets/<int:pet_id>/delete', methods=['POST'])
+@login_required
+def delete_pet(pet_id):
+    pet = Pet.query.get_or_404(pet_id)
+    if pet.user_id != current_user.id:
+        abort(403)
+    
+    form = DeletePetForm()
+    if not form.validate_on_submit():
+        flash('Your session has expired. Please try again.', 'danger')
+        return redirect(url_for('pet_detail', pet_id=pet.id))
+    
+    # Drop the pet's reference to its photo; the files go once no other record
+    # uses them, and only after the delete is committed
+    released = release_upload(pet.image_filename) if pet.image_filename else []
+    name = pet.name
+    db.session.delete(pet)
+    after_commit(lambda: remove_files(released))
+    after_commit(lambda: fragment_cache.invalidate(FEATURED_PETS))
+    db.session.commit()
+    
+    flash(f'{name} has been removed.', 'success')
+    return redirect(url_for('profile'))
+
+
 @app.route('/products')
 def products():
     category = request.args.get('category', '')
     page = request.args.get('page', 1, type=int)
     per_page = 12
     
+    # Nothing to do if no product has changed since the client's copy
+    products_latest, products_deletes = table_watermark(Product)
+    not_modified = conditional_get(products_latest, products_deletes)
+    if not_modified:
+        return not_modified
+    
     # Get all unique categories for the filter
     categories = [c[0] for c in db.session.query(Product.category).distinct()]
     
@@ -200,16 +293,33 @@ def products():
     if category:
         query = query.filter_by(category=category)
     
-    # Get paginated results
-    products = query.paginate(page=page, per_page=per_page)
+    # Get paginated results (seek by id unless an old ?page= link was followed)
+    keyset = 'page' not in request.args
+    if keyset:
+        # Only categories that exist are counted and cached; the parameter is client-controlled
+        total = 0
+        if not category or category in categories:
+            total = cached_count(('products', category), query)
+        products = keyset_paginate(query, [Product.id], request.args.get('cursor'), per_page,
+                                   descending=False, total=total)
+    else:
+        products = query.order_by(Product.id).paginate(page=page, per_page=per_page)
     
-    return render_template('products.html', products=products, categories=categories, active_category=category)
+    return render_template('products.html', products=products, categories=categories, active_category=category,
+                           keyset=keyset)
 
 
 @app.route('/products/<int:product_id>')
 def product_detail(product_id):
     product = Product.query.get_or_404(product_id)
     
+    # The page shows the product and others from its category. The whole table's
+    # watermark is one index lookup, and also sees products moving out of the category
+    products_latest, products_deletes = table_watermark(Product)
+    not_modified = conditional_get(product.updated_at, products_latest, products_deletes)
+    if not_modified:
+        return not_modified
+    
     # Get related products (same category, excluding this product)
     related_products = Product.query.filter(
         Product.category == product.category,
@@ -222,16 +332,10 @@ def product_detail(product_id):
 @app.route('/cart')
 @login_required
 def view_cart():
-    # Get user's cart items with product details
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    
-    # Calculate total price
-    total_price = sum(item.product.price * item.quantity for item in cart_items)
+    # Get user's cart items with product details and totals in one round trip
+    cart = load_cart(current_user.id)
     
-    # Shipping cost (could be calculated based on cart total or other factors)
-    shipping = 5.99 if total_price > 0 else 0
-    
-    return render_template('cart.html', cart_items=cart_items, total_price=total_price, shipping=shipping)
+    return render_template('cart.html', cart_items=cart.items, total_price=cart.subtotal, shipping=cart.shipping)
 
 
 @app.route('/cart/add/<int:product_id>', methods=['POST'])
@@ -258,7 +362,6 @@ def add_to_cart(product_id):
     if cart_item:
         # Update quantity if already in cart
         cart_item.quantity += quantity
-        db.session.commit()
     else:
         # Add new item to cart
         cart_item = CartItem(
@@ -267,7 +370,10 @@ def add_to_cart(product_id):
             quantity=quantity
         )
         db.session.add(cart_item)
-        db.session.commit()
+    
+    # Keep the cached cart count in step with the cart
+    refresh_cart_count(current_user.id)
+    db.session.commit()
     
     flash(f'{product.name} added to your cart', 'success')
     return redirect(url_for('view_cart'))
@@ -276,7 +382,8 @@ def add_to_cart(product_id):
 @app.route('/cart/update/<int:item_id>', methods=['POST'])
 @login_required
 def update_cart_item(item_id):
-    cart_item = CartItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
+    cart_item = (CartItem.query.options(joinedload(CartItem.product))
+                 .filter_by(id=item_id, user_id=current_user.id).first_or_404())
     
     data = request.get_json()
     quantity = int(data.get('quantity', 1))
@@ -291,22 +398,19 @@ def update_cart_item(item_id):
     
     # Update quantity
     cart_item.quantity = quantity
-    db.session.commit()
+    subtotal = cart_item.product.price * quantity
+    refresh_cart_count(current_user.id)
     
     # Calculate new values for response
-    subtotal = cart_item.product.price * cart_item.quantity
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    cart_subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    cart_count = sum(item.quantity for item in cart_items)
-    shipping = 5.99 if cart_subtotal > 0 else 0
-    cart_total = cart_subtotal + shipping
+    cart = cart_totals(current_user.id)
+    db.session.commit()
     
     return jsonify({
         'success': True,
         'subtotal': subtotal,
-        'cart_subtotal': cart_subtotal,
-        'cart_total': cart_total,
-        'cart_count': cart_count
+        'cart_subtotal': cart.subtotal,
+        'cart_total': cart.total,
+        'cart_count': cart.count
     })
 
 
@@ -316,21 +420,18 @@ def remove_cart_item(item_id):
     cart_item = CartItem.query.filter_by(id=item_id, user_id=current_user.id).first_or_404()
     
     db.session.delete(cart_item)
-    db.session.commit()
+    refresh_cart_count(current_user.id)
     
     # Calculate new values for response
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
-    cart_subtotal = sum(item.product.price * item.quantity for item in cart_items)
-    cart_count = sum(item.quantity for item in cart_items)
-    shipping = 5.99 if cart_subtotal > 0 else 0
-    cart_total = cart_subtotal + shipping
+    cart = cart_totals(current_user.id)
+    db.session.commit()
     
     return jsonify({
         'success': True,
-        'cart_subtotal': cart_subtotal,
-        'cart_total': cart_total,
-        'cart_count': cart_count,
-        'cart_empty': len(cart_items) == 0
+        'cart_subtotal': cart.subtotal,
+        'cart_total': cart.total,
+        'cart_count': cart.count,
+        'cart_empty': cart.lines == 0
     })
 
 
@@ -338,6 +439,7 @@ def remove_cart_item(item_id):
 @login_required
 def clear_cart():
     CartItem.query.filter_by(user_id=current_user.id).delete()
+    refresh_cart_count(current_user.id)
     db.session.commit()
     
     return jsonify({
@@ -349,64 +451,32 @@ def clear_cart():
 @app.route('/checkout', methods=['GET', 'POST'])
 @login_required
 def checkout():
-    cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+    cart = load_cart(current_user.id)
+    cart_items = cart.items
     
     if not cart_items:
         flash('Your cart is empty', 'warning')
         return redirect(url_for('products'))
     
     if request.method == 'POST':
-        # Calculate total price
-        total_price = sum(item.product.price * item.quantity for item in cart_items)
-        shipping = 5.99 if total_price > 0 else 0
-        final_total = total_price + shipping
-        
-        # Create new order
-        order = Order(
-            user_id=current_user.id,
-            total_amount=final_total,
-            shipping_address=f"{current_user.address}, {current_user.city}, {current_user.state} {current_user.zip_code}"
-        )
-        db.session.add(order)
-        db.session.flush()  # Flush to get the order ID
-        
-        # Create order items
-        for cart_item in cart_items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=cart_item.product_id,
-                quantity=cart_item.quantity,
-                price=cart_item.product.price
-            )
-            db.session.add(order_item)
-            
-            # Update product stock
-            product = cart_item.product
-            product.stock -= cart_item.quantity
-            
-        # Clear the cart
-        CartItem.query.filter_by(user_id=current_user.id).delete()
-        
-        db.session.commit()
+        # Reserve stock, create the order and clear the cart in one transaction
+        try:
+            place_order(current_user, cart)
+        except InsufficientStock as e:
+            flash(f"Sorry, there isn't enough stock left for: {', '.join(e.product_names)}", 'danger')
+            return redirect(url_for('view_cart'))
         
         flash('Your order has been placed successfully!', 'success')
         return redirect(url_for('profile'))
     
     # GET request - show checkout page
-    # Calculate total price
-    total_price = sum(item.product.price * item.quantity for item in cart_items)
-    shipping = 5.99 if total_price > 0 else 0
-    
-    return render_template('checkout.html', cart_items=cart_items, total_price=total_price, shipping=shipping)
+    return render_template('checkout.html', cart_items=cart_items, total_price=cart.subtotal, shipping=cart.shipping)
 
 
 @app.route('/donate', methods=['GET', 'POST'])
 def donate():
     form = DonationForm()
     
-    # Get recent donations for display (non-anonymous only)
-    recent_donations = Donation.query.filter_by(is_anonymous=False).order_by(Donation.donation_date.desc()).limit(5).all()
-    
     # Handle anonymous donations (no login required)
     if form.validate_on_submit():
         user_id = current_user.id if current_user.is_authenticated else None
@@ -419,12 +489,17 @@ def donate():
         )
         
         db.session.add(donation)
+        after_commit(lambda: fragment_cache.invalidate(*DONATION_FRAGMENTS))
         db.session.commit()
         
         flash('Thank you for your donation!', 'success')
         return redirect(url_for('donate'))
     
-    return render_template('donate.html', form=form, recent_donations=recent_donations)
+    # Recent donations for display (non-anonymous only), cached until the next donation
+    recent_donations_html = fragment_cache.render(DONATION_TABLE, lambda: render_template(
+        'fragments/donation_table.html', recent_donations=recent_public_donations(5)))
+    
+    return render_template('donate.html', form=form, recent_donations_html=recent_donations_html)
 
 
 @app.route('/pet-match', methods=['GET', 'POST'])
@@ -449,6 +524,11 @@ def pet_match():
         # Store preferences in session for API use
         session['match_preferences'] = preferences
         
+        # Signed-in applicants keep their profile so new pets can be matched to them
+        if current_user.is_authenticated:
+            save_match_profile(current_user, preferences)
+            db.session.commit()
+        
         # Redirect to results
         return redirect(url_for('pet_match_results'))
     
@@ -463,22 +543,15 @@ def pet_match_results():
         flash('Please fill out the pet matching form first.', 'warning')
         return redirect(url_for('pet_match'))
     
-    # Get all available pets
-    available_pets = Pet.query.filter_by(adoption_status='available').all()
+    cursor = request.args.get('cursor')
     
-    # Calculate match scores
-    matching_pets = []
-    for pet in available_pets:
-        score = calculate_match_score(pet, preferences)
-        matching_pets.append((pet, score))
+    # Select only this page of matches (at least 50% match, highest first)
+    page, total_matches, next_cursor = match_engine.top_matches(
+        preferences, MATCH_PAGE_SIZE, after=decode_cursor(cursor), min_score=50)
+    matching_pets = load_match_page(page)
     
-    # Sort by score (highest first)
-    matching_pets.sort(key=lambda x: x[1], reverse=True)
-    
-    # Only show pets with at least 50% match
-    matching_pets = [match for match in matching_pets if match[1] >= 50]
-    
-    return render_template('pet_match_results.html', matching_pets=matching_pets, preferences=preferences)
+    return render_template('pet_match_results.html', matching_pets=matching_pets, preferences=preferences,
+                           total_matches=total_matches, next_cursor=next_cursor, is_first_page=not cursor)
 
 
 @app.route('/api/pet-match', methods=['POST'])
@@ -488,7 +561,100 @@ def api_pet_match():
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    preferences = {
+    preferences = api_match_preferences(data)
+    
+    # Page size and position, from the query string or the JSON body
+    try:
+        limit = int(request.args.get('limit', data.get('limit', MATCH_PAGE_SIZE)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, MAX_API_MATCH_LIMIT))
+    cursor = request.args.get('cursor', data.get('cursor'))
+    after = decode_cursor(cursor)
+    if cursor and after is None:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    
+    # Select only this page of matches (at least 50% match, highest first)
+    page, total_matches, next_cursor = match_engine.top_matches(preferences, limit, after=after, min_score=50)
+    
+    matching_pets = [api_match_json(pet, score) for pet, score in load_match_page(page)]
+    
+    # Return the matches
+    return jsonify({
+        'matches': matching_pets,
+        'count': len(matching_pets),
+        'total': total_matches,
+        'next_cursor': next_cursor
+    })
+
+
+@app.route('/api/pet-match/batch', methods=['POST'])
+def api_pet_match_batch():
+    # {"profiles": [preferences, ...], "limit": n}; each profile uses the /api/pet-match schema
+    data = request.get_json(silent=True)
+    profiles = data.get('profiles') if isinstance(data, dict) else None
+    if not isinstance(profiles, list) or not all(isinstance(profile, dict) for profile in profiles):
+        return jsonify({'error': 'Expected a list of preference profiles'}), 400
+    max_profiles = MAX_BATCH_MATCH_PROFILES if current_user.is_authenticated else MAX_ANONYMOUS_BATCH_MATCH_PROFILES
+    if len(profiles) > max_profiles:
+        return jsonify({'error': f'At most {max_profiles} profiles per request'}), 400
+    try:
+        limit = int(request.args.get('limit', data.get('limit', MATCH_PAGE_SIZE)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, MAX_API_MATCH_LIMIT))
+    
+    # Every profile is scored against the same snapshot in one vectorized pass
+    results = match_engine.top_matches_batch([api_match_preferences(profile) for profile in profiles],
+                                             limit, min_score=50)
+    
+    # Load each matched pet once, however many profiles it appears in: only the
+    # columns the response uses, a bounded number of ids per statement
+    pet_ids = sorted({pet_id for page, _ in results for pet_id, _ in page})
+    pets = {}
+    for start in range(0, len(pet_ids), ID_LOOKUP_CHUNK):
+        chunk = pet_ids[start:start + ID_LOOKUP_CHUNK]
+        rows = db.session.query(*API_MATCH_COLUMNS).filter(Pet.id.in_(chunk))
+        pets.update((row.id, row) for row in rows)
+    
+    batch = []
+    for profile, (page, total) in zip(profiles, results):
+        matches = [api_match_json(pets[pet_id], score) for pet_id, score in page if pet_id in pets]
+        batch.append({
+            'profile_id': profile.get('id'),
+            'matches': matches,
+            'count': len(matches),
+            'total': total
+        })
+    
+    return jsonify({'results': batch, 'count': len(batch)})
+
+
+@app.route('/api/pets/<int:pet_id>/applicants')
+@login_required
+def api_pet_applicants(pet_id):
+    # Applicants whose saved match profile fits this pet best (pet owner only)
+    pet = Pet.query.get_or_404(pet_id)
+    if pet.user_id != current_user.id:
+        return jsonify({'error': 'Only the pet owner can see matching applicants'}), 403
+    limit = max(1, min(request.args.get('limit', MATCH_PAGE_SIZE, type=int), MAX_API_APPLICANT_LIMIT))
+    
+    applicants, total = applicant_index.top_applicants(pet, limit, min_score=50, exclude={pet.user_id})
+    users = {user.id: user for user in User.query.filter(User.id.in_([user_id for user_id, _ in applicants]))}
+    # Applicants deleted since the index last saw them are left out
+    applicants = [{'user_id': user_id, 'username': users[user_id].username, 'match_score': score}
+                  for user_id, score in applicants if user_id in users]
+    
+    return jsonify({
+        'applicants': applicants,
+        'count': len(applicants),
+        'total': total
+    })
+
+
+def api_match_preferences(data):
+    """Preference dict for the match engine from an API request body"""
+    return {
         'species': data.get('species', 'any'),
         'age_preference': data.get('age_preference', 'any'),
         'gender_preference': data.get('gender_preference', 'any'),
@@ -501,35 +667,92 @@ def api_pet_match():
         'time_availability': data.get('time_availability', 'any'),
         'training_preference': data.get('training_preference', 'any')
     }
+
+
+# Pet columns api_match_json reads
+API_MATCH_COLUMNS = (Pet.id, Pet.name, Pet.species, Pet.breed, Pet.age, Pet.gender, Pet.image_filename)
+
+
+def api_match_json(pet, score):
+    return {
+        'id': pet.id,
+        'name': pet.name,
+        'species': pet.species,
+        'breed': pet.breed,
+        'age': pet.age,
+        'gender': pet.gender,
+        'image_url': url_for('static', filename=f'uploads/{pet.image_filename}', _external=True) if pet.image_filename else None,
+        'match_score': score
+    }
+
+
+@app.route('/api/pets')
+def api_pets():
+    # Same filters as the /pets search form
+    form = SearchForm(request.args, meta={'csrf': False})
+    if not form.validate():
+        return jsonify({'error': 'Invalid filters', 'fields': form.errors}), 400
+    output_format = request.args.get('format', 'ndjson')
+    if output_format not in FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    try:
+        fields = select_fields(request.args.get('fields'), PET_FIELDS, DEFAULT_PET_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Get all available pets
-    available_pets = Pet.query.filter_by(adoption_status='available').all()
-    
-    # Calculate match scores
-    matching_pets = []
-    for pet in available_pets:
-        score = calculate_match_score(pet, preferences)
-        if score >= 50:  # Only include pets with at least 50% match
-            pet_data = {
-                'id': pet.id,
-                'name': pet.name,
-                'species': pet.species,
-                'breed': pet.breed,
-                'age': pet.age,
-                'gender': pet.gender,
-                'image_url': url_for('static', filename=f'uploads/{pet.image_filename}', _external=True) if pet.image_filename else None,
-                'match_score': score
-            }
-            matching_pets.append(pet_data)
+    query = Pet.query.filter_by(adoption_status='available')
+    if form.query.data:
+        query = filter_pets_by_text(query, form.query.data)
+    if form.species.data:
+        query = query.filter(Pet.species == form.species.data)
+    query = query.order_by(Pet.created_at.desc(), Pet.id.desc())
     
-    # Sort by score (highest first)
-    matching_pets.sort(key=lambda x: x['match_score'], reverse=True)
+    return stream_catalogue(query, Pet, fields, output_format)
+
+
+@app.route('/api/products')
+def api_products():
+    output_format = request.args.get('format', 'ndjson')
+    if output_format not in FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    try:
+        fields = select_fields(request.args.get('fields'), PRODUCT_FIELDS, DEFAULT_PRODUCT_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Return the matches
-    return jsonify({
-        'matches': matching_pets,
-        'count': len(matching_pets)
-    })
+    query = Product.query
+    category = request.args.get('category', '')
+    if category:
+        query = query.filter_by(category=category)
+    query = query.order_by(Product.id)
+    
+    return stream_catalogue(query, Product, fields, output_format)
+
+
+@app.route('/api/job-stats')
+@token_required
+def api_job_stats():
+    return jsonify(queue_stats())
+
+
+@app.route('/api/fragment-cache-stats')
+@token_required
+def api_fragment_cache_stats():
+    return jsonify(fragment_cache.stats())
+
+
+@app.route('/api/pet-match/cache-stats')
+@token_required
+def api_pet_match_cache_stats():
+    stats = match_engine.results.stats()
+    stats['snapshot_version'] = match_engine.version
+    return jsonify(stats)
+
+
+def load_match_page(page):
+    """Load the Pet rows for a page of (pet_id, score) matches, keeping rank order"""
+    pets = {pet.id: pet for pet in Pet.query.filter(Pet.id.in_([pet_id for pet_id, _ in page])).all()}
+    return [(pets[pet_id], score) for pet_id, score in page if pet_id in pets]
 
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -790,7 +1013,31 @@ def initialize_db():
     # For now, we'll proceed without downloading images for products
     pass
 
-# Pet matching algorithm
+
+def init_db():
+    """Create missing tables, upgrade older databases and create the search index (idempotent)"""
+    db.create_all()
+    # Add columns and indexes missing from databases created by older versions
+    upgrade_schema()
+    # Create the full-text search index for pets
+    ensure_search_index()
+
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema; run once per deploy, before starting workers."""
+    init_db()
+    click.echo('Database schema is up to date')
+
+
+@app.cli.command('seed-db')
+def seed_db_command():
+    """Add the sample user, products and pets to an empty database."""
+    initialize_db()
+    click.echo('Sample data added where missing')
+
+# Pet matching algorithm (reference implementation; the match routes use the
+# vectorized matching.MatchEngine, which must return identical scores)
 def calculate_match_score(pet, preferences):
     """
     Calculate a match score between a pet and user preferences.
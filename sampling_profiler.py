@@ -0,0 +1,161 @@
+import atexit
+import hmac
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+
+from app import app
+
+
+# Request header that turns profiling on for one request; must equal PROFILE_TOKEN
+PROFILE_HEADER = 'X-Profile'
+# Leaf frames listed in the log line written with each dump
+TOP_FRAMES = 5
+
+_SITE_PACKAGES = 'site-packages' + os.sep
+
+
+def frame_name(frame):
+    """A short, stable name for a stack frame: path relative to the app or its package"""
+    filename = frame.f_code.co_filename
+    if filename.startswith(app.root_path + os.sep):
+        filename = filename[len(app.root_path) + 1:]
+    elif _SITE_PACKAGES in filename:
+        filename = filename.split(_SITE_PACKAGES, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f'{filename}:{frame.f_code.co_name}'
+
+
+def fold(frame):
+    """A stack, outermost frame first, in the collapsed format flamegraph tools read"""
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads serving profiled requests every
+    `interval` seconds from a background thread, and writes the counts
+    aggregated per endpoint as collapsed-stack files every `window`
+    seconds. Profiled code isn't instrumented, so the cost is one
+    sys._current_frames() call per interval while profiled requests run.
+    """
+
+    def __init__(self, interval, window, folder):
+        self.interval = interval
+        self.window = window
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._targets = {}  # thread id -> endpoint of the request it is serving
+        self._stacks = {}  # endpoint -> Counter of folded stack -> samples
+        self._requests = Counter()  # endpoint -> profiled requests this window
+        self._window_started = time.monotonic()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def start_request(self, endpoint):
+        with self._lock:
+            self._targets[threading.get_ident()] = endpoint
+            self._requests[endpoint] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def finish_request(self):
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def sample(self):
+        """Record the current stack of every profiled thread"""
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, endpoint in self._targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._stacks.setdefault(endpoint, Counter())[fold(frame)] += 1
+
+    def _run(self):
+        while True:
+            if not self._targets:
+                # Idle until a profiled request starts (or the window ends)
+                self._wakeup.wait(self.window)
+                self._wakeup.clear()
+            else:
+                time.sleep(self.interval)
+                self.sample()
+            if time.monotonic() - self._window_started >= self.window:
+                self.dump()
+
+    def dump(self):
+        """Write and reset the samples collected so far; returns the files written"""
+        with self._lock:
+            stacks, self._stacks = self._stacks, {}
+            requests, self._requests = self._requests, Counter()
+            self._window_started = time.monotonic()
+        if not stacks:
+            return []
+        os.makedirs(self.folder, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+        paths = []
+        for endpoint, counts in stacks.items():
+            path = os.path.join(self.folder, f'{endpoint}-{stamp}-{os.getpid()}.folded')
+            with open(path, 'w') as profile_file:
+                for stack, samples in counts.most_common():
+                    profile_file.write(f'{stack} {samples}\n')
+            paths.append(path)
+
+            total = sum(counts.values())
+            leaves = Counter()
+            for stack, samples in counts.items():
+                leaves[stack.rsplit(';', 1)[-1]] += samples
+            top = ', '.join(f'{name} {samples * 100 / total:.0f}%' for name, samples in leaves.most_common(TOP_FRAMES))
+            app.logger.info(f'Profile of {endpoint}: {requests[endpoint]} requests, {total} samples '
+                            f'({self.interval * 1000:g} ms apart) in {path}; top frames: {top}')
+        return paths
+
+
+profiler = SamplingProfiler(interval=app.config.get('PROFILE_INTERVAL_MS', 5) / 1000,
+                            window=app.config.get('PROFILE_WINDOW', 60),
+                            folder=app.config.get('PROFILE_FOLDER', 'profiles'))
+
+
+def _wants_profile():
+    if request.endpoint in app.config.get('PROFILE_ENDPOINTS', ()):
+        return True
+    token = app.config.get('PROFILE_TOKEN')
+    if not token:
+        return False
+    # Constant-time, so response timing doesn't reveal how much of a guess matched.
+    # Bytes, since compare_digest rejects non-ASCII strings and headers can hold any
+    supplied = request.headers.get(PROFILE_HEADER, '')
+    return hmac.compare_digest(supplied.encode(), token.encode())
+
+
+def _start_profile():
+    if request.endpoint and _wants_profile():
+        g.sampling_profile = True
+        profiler.start_request(request.endpoint)
+
+
+def _finish_profile(exception=None):
+    if g.pop('sampling_profile', False):
+        profiler.finish_request()
+
+
+# Only hooked in when some endpoint or request can be profiled
+if app.config.get('PROFILE_ENDPOINTS') or app.config.get('PROFILE_TOKEN'):
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
+    # Samples from a partly filled window aren't lost when the worker exits
+    atexit.register(profiler.dump)
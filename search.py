@@ -0,0 +1,150 @@
+import re
+
+from sqlalchemy import column, false, func, literal_column, table, text
+
+from app import app, db
+from models import Pet
+
+
+# bm25 weights for the name, breed and description columns
+SQLITE_WEIGHTS = (10.0, 5.0, 1.0)
+
+# SQLite: external-content FTS5 table kept in sync with `pet` by triggers
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS pet_fts USING fts5(
+        name, breed, description,
+        content='pet', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pet_fts_insert AFTER INSERT ON pet BEGIN
+        INSERT INTO pet_fts(rowid, name, breed, description)
+        VALUES (new.id, new.name, new.breed, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pet_fts_delete AFTER DELETE ON pet BEGIN
+        INSERT INTO pet_fts(pet_fts, rowid, name, breed, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS pet_fts_update AFTER UPDATE OF name, breed, description ON pet BEGIN
+        INSERT INTO pet_fts(pet_fts, rowid, name, breed, description)
+        VALUES ('delete', old.id, old.name, old.breed, old.description);
+        INSERT INTO pet_fts(rowid, name, breed, description)
+        VALUES (new.id, new.name, new.breed, new.description);
+    END
+    """,
+]
+
+# Postgres: weighted tsvector over the same columns, backed by an expression GIN index.
+# The query below must use this exact expression for the index to be picked up.
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('simple', coalesce(pet.name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(pet.breed, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(pet.description, '')), 'C')"
+)
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_pet_search_document ON pet USING GIN (({POSTGRES_DOCUMENT}))",
+]
+
+pet_fts = table('pet_fts', column('rowid'))
+
+# Backend in use: 'fts5', 'postgres' or 'like'. Set by ensure_search_index(), or
+# looked up on first search in processes that didn't run it (web workers)
+_backend = None
+
+
+def ensure_search_index():
+    """Create the full-text index for pets if needed (idempotent)"""
+    global _backend
+    dialect = db.engine.dialect.name
+    try:
+        with db.engine.begin() as connection:
+            if dialect == 'sqlite':
+                exists = connection.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = 'pet_fts'")).first()
+                for statement in SQLITE_DDL:
+                    connection.execute(text(statement))
+                if not exists:
+                    # Index the rows that were there before the FTS table
+                    connection.execute(text("INSERT INTO pet_fts(pet_fts) VALUES ('rebuild')"))
+                _backend = 'fts5'
+            elif dialect == 'postgresql':
+                for statement in POSTGRES_DDL:
+                    connection.execute(text(statement))
+                _backend = 'postgres'
+    except Exception as e:
+        app.logger.warning(f"Full-text search unavailable, falling back to LIKE: {str(e)}")
+        _backend = 'like'
+    app.logger.info(f'Pet search backend: {_backend}')
+
+
+def search_backend():
+    """The search backend, checking which index exists the first time (no DDL)"""
+    global _backend
+    if _backend is None:
+        dialect = db.engine.dialect.name
+        try:
+            with db.engine.connect() as connection:
+                if dialect == 'sqlite':
+                    exists = connection.execute(
+                        text("SELECT 1 FROM sqlite_master WHERE name = 'pet_fts'")).first()
+                    backend = 'fts5' if exists else 'like'
+                elif dialect == 'postgresql':
+                    exists = connection.execute(
+                        text("SELECT 1 FROM pg_indexes WHERE indexname = 'ix_pet_search_document'")).first()
+                    backend = 'postgres' if exists else 'like'
+                else:
+                    backend = 'like'
+        except Exception as e:
+            app.logger.warning(f"Couldn't check the search index, using LIKE: {str(e)}")
+            backend = 'like'
+        if backend == 'like':
+            app.logger.warning('Full-text search index missing (run `flask init-db`), using LIKE')
+        _backend = backend
+    return _backend
+
+
+def search_terms(query_text):
+    """Split free text into search terms (letters and digits only)"""
+    return re.findall(r'\w+', query_text or '')
+
+
+def filter_pets_by_text(query, query_text):
+    """
+    Restrict a Pet query to rows matching the search text, best matches
+    first. Every term must match, and the last term matches as a prefix
+    so results update while the user is still typing.
+    """
+    terms = search_terms(query_text)
+    if not terms:
+        # Only punctuation or spaces: nothing can match, rather than everything
+        return query.filter(false())
+
+    backend = search_backend()
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        ranked = (db.session.query(pet_fts.c.rowid.label('pet_id'),
+                                   func.bm25(literal_column('pet_fts'), *SQLITE_WEIGHTS).label('rank'))
+                  .filter(literal_column('pet_fts').op('MATCH')(match))
+                  .subquery())
+        # bm25() is lower for better matches
+        query = query.join(ranked, ranked.c.pet_id == Pet.id).order_by(ranked.c.rank)
+        return query
+
+    if backend == 'postgres':
+        document = literal_column(POSTGRES_DOCUMENT)
+        tsquery = func.to_tsquery('simple', ' & '.join(terms[:-1] + [f'{terms[-1]}:*']))
+        query = query.filter(document.op('@@')(tsquery)).order_by(func.ts_rank(document, tsquery).desc())
+        return query
+
+    search_term = f"%{query_text}%"
+    query = query.filter((Pet.name.like(search_term)) |
+                         (Pet.breed.like(search_term)) |
+                         (Pet.description.like(search_term)))
+    return query
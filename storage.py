@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+
+from flask import request
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.utils import secure_filename
+
+from app import app, db
+from images import rendition_files
+from models import UploadBlob
+
+
+# Content-addressed uploads live under UPLOAD_FOLDER/blobs/<aa>/<bb>/<sha256><ext>
+BLOB_FOLDER = 'blobs'
+CHUNK_SIZE = 64 * 1024
+
+# URL prefixes of files whose name is derived from their contents and so never change
+IMMUTABLE_PREFIXES = ('/static/uploads/blobs/', '/static/uploads/renditions/blobs/')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def blob_filename(digest, extension):
+    """Sharded path of a blob relative to the upload folder"""
+    return f'{BLOB_FOLDER}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def store_upload(file_storage):
+    """
+    Stream an uploaded file into the blob store and take a reference to it.
+    Identical contents are stored once. Returns the path relative to the
+    upload folder. The reference count change is part of the current
+    session and is committed together with the record that uses the file.
+    """
+    upload_folder = app.config['UPLOAD_FOLDER']
+    extension = os.path.splitext(secure_filename(file_storage.filename or ''))[1].lower()
+
+    # Hash while streaming to a temporary file on the same filesystem
+    digest = hashlib.sha256()
+    size = 0
+    handle, temp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            while True:
+                chunk = file_storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+        digest = digest.hexdigest()
+
+        # The reference comes first and the temporary copy is kept until then: from
+        # here on no release can delete the blob, and if one removed the file just
+        # before, this copy puts it back
+        filename = _take_reference(digest, blob_filename(digest, extension), size)
+        path = os.path.join(upload_folder, filename)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return filename
+
+
+def _take_reference(digest, filename, size):
+    """Count one more use of the blob with this digest (created as `filename` if new); returns its filename"""
+    # The UPDATE also opens the write transaction, so with pysqlite the
+    # savepoint below nests in it instead of committing on release
+    if not _add_reference(digest):
+        try:
+            # A concurrent upload of the same new file may insert the digest
+            # first; only this insert is undone when it does
+            with db.session.begin_nested():
+                db.session.add(UploadBlob(digest=digest, filename=filename, size=size, refcount=1))
+            return filename
+        except IntegrityError:
+            _add_reference(digest)
+    # Possibly stored by an earlier upload under a different extension
+    return db.session.query(UploadBlob.filename).filter_by(digest=digest).scalar()
+
+
+def _add_reference(digest):
+    """Count one more use of a stored blob; False when there is none with that digest"""
+    return UploadBlob.query.filter_by(digest=digest).update(
+        {'refcount': UploadBlob.refcount + 1}, synchronize_session=False) > 0
+
+
+def release_upload(filename):
+    """
+    Drop one reference to a stored upload, e.g. when the record using it is
+    deleted. Returns the files to remove once the session commits (empty
+    while other records still reference the blob).
+    """
+    UploadBlob.query.filter_by(filename=filename).update(
+        {'refcount': UploadBlob.refcount - 1}, synchronize_session=False)
+    # One conditional DELETE: the row stays locked by this transaction until it
+    # commits, so the blob only goes if no upload took a reference meanwhile
+    deleted = UploadBlob.query.filter(UploadBlob.filename == filename, UploadBlob.refcount <= 0).delete(
+        synchronize_session=False)
+    return [filename] if deleted else []
+
+
+def remove_files(filenames):
+    """Delete released uploads (and their renditions) after the commit that released them"""
+    if not filenames:
+        return
+    upload_folder = app.config['UPLOAD_FOLDER']
+    # A fresh connection: this runs while the releasing session is finishing its commit
+    with db.engine.connect() as connection:
+        stored_again = set(connection.scalars(
+            select(UploadBlob.filename).where(UploadBlob.filename.in_(filenames))))
+    for filename in filenames:
+        if filename in stored_again:
+            continue  # Uploaded again since the release; the new blob owns the file
+        paths = [filename] + rendition_files(filename)
+        for path in paths:
+            try:
+                os.remove(os.path.join(upload_folder, path))
+            except FileNotFoundError:
+                pass
+
+
+@app.after_request
+def add_immutable_cache_headers(response):
+    # Content-addressed files can be cached forever by browsers and proxies
+    if response.status_code in (200, 304) and request.path.startswith(IMMUTABLE_PREFIXES):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,99 @@
+import itertools
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# A throwaway SQLite database (a file, so threads share it); set before the app is imported
+_folder = tempfile.mkdtemp(prefix='pet-management-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_folder, 'test.db')}"
+# Queued jobs stay queued; no background workers during tests
+os.environ['JOB_WORKERS'] = '0'
+
+from wsgi import app as flask_app  # noqa: E402
+from app import db  # noqa: E402
+from models import User, Product, CartItem  # noqa: E402
+from routes import init_db  # noqa: E402
+
+_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False,
+                            UPLOAD_FOLDER=os.path.join(_folder, 'uploads'))
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    with flask_app.app_context():
+        init_db()
+    return flask_app
+
+
+@pytest.fixture
+def make_user(app):
+    def make_user(**fields):
+        number = next(_numbers)
+        with app.app_context():
+            user = User(username=f'tester{number}', email=f'tester{number}@example.com',
+                        password_hash='-', address='1 Test Street', city='Testville', **fields)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make_user
+
+
+@pytest.fixture
+def make_product(app):
+    def make_product(stock=100, price=10.0, category='Toys'):
+        number = next(_numbers)
+        with app.app_context():
+            product = Product(name=f'Product {number}', category=category, price=price, stock=stock)
+            db.session.add(product)
+            db.session.commit()
+            return product.id
+    return make_product
+
+
+@pytest.fixture
+def fill_cart(app):
+    def fill_cart(user_id, quantities):
+        """Put {product_id: quantity} into a user's cart"""
+        from cart import refresh_cart_count
+
+        with app.app_context():
+            for product_id, quantity in quantities.items():
+                db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=quantity))
+            refresh_cart_count(user_id)
+            db.session.commit()
+    return fill_cart
+
+
+def login(client, user_id):
+    """Sign a test client in as the user without going through the login form"""
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+@contextmanager
+def count_statements(app):
+    """Collect the SQL statements the app runs inside the block"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
@@ -0,0 +1,22 @@
+from app import db
+from applicants import applicant_index
+from models import Pet
+from conftest import login
+
+
+def test_count_leaves_out_applicants_no_longer_there(app, make_user, monkeypatch):
+    owner_id, applicant_id = make_user(), make_user()
+    with app.app_context():
+        pet = Pet(name='Counted', species='cat', description='Calm', user_id=owner_id)
+        db.session.add(pet)
+        db.session.commit()
+        pet_id = pet.id
+    # The index still lists a user deleted since it last loaded
+    monkeypatch.setattr(applicant_index, 'top_applicants',
+                        lambda pet, limit, **options: ([(applicant_id, 90), (10 ** 9, 80)], 2))
+
+    response = login(app.test_client(), owner_id).get(f'/api/pets/{pet_id}/applicants')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [applicant['user_id'] for applicant in data['applicants']] == [applicant_id]
+    assert data['count'] == 1
@@ -0,0 +1,33 @@
+import pytest
+
+from models import CartItem
+from conftest import login, count_statements
+
+
+def cart_request(app, make_user, make_product, fill_cart, lines, route):
+    """Statements run by one cart request for a user with `lines` products in the cart"""
+    user_id = make_user()
+    fill_cart(user_id, {make_product(): 1 for _ in range(lines)})
+    with app.app_context():
+        item_id = CartItem.query.filter_by(user_id=user_id).first().id
+    client = login(app.test_client(), user_id)
+
+    method, url, body = route
+    with count_statements(app) as statements:
+        response = client.open(url.format(item_id=item_id), method=method, json=body)
+    assert response.status_code in (200, 302)
+    return statements
+
+
+@pytest.mark.parametrize('route', [
+    ('GET', '/cart', None),
+    ('GET', '/checkout', None),
+    ('POST', '/cart/update/{item_id}', {'quantity': 2}),
+    ('POST', '/cart/remove/{item_id}', None),
+    ('POST', '/cart/clear', None),
+    ('POST', '/checkout', None),
+])
+def test_cart_statements_do_not_grow_with_cart_size(app, make_user, make_product, fill_cart, route):
+    small = cart_request(app, make_user, make_product, fill_cart, 1, route)
+    large = cart_request(app, make_user, make_product, fill_cart, 12, route)
+    assert len(large) == len(small), '\n'.join(large)
@@ -0,0 +1,77 @@
+import threading
+
+from sqlalchemy import func
+
+from app import db
+from models import Order, OrderItem, Product, CartItem
+from conftest import login
+
+
+def sold_and_stock(app, product_id):
+    with app.app_context():
+        sold = (db.session.query(func.coalesce(func.sum(OrderItem.quantity), 0))
+                .filter(OrderItem.product_id == product_id).scalar())
+        return sold, db.session.get(Product, product_id).stock
+
+
+def test_checkout_reserves_stock_and_clears_cart(app, make_user, make_product, fill_cart):
+    user_id = make_user()
+    product_id = make_product(stock=10)
+    fill_cart(user_id, {product_id: 3})
+
+    response = login(app.test_client(), user_id).post('/checkout')
+
+    assert response.status_code == 302
+    assert sold_and_stock(app, product_id) == (3, 7)
+    with app.app_context():
+        assert CartItem.query.filter_by(user_id=user_id).count() == 0
+        assert Order.query.filter_by(user_id=user_id).count() == 1
+
+
+def test_insufficient_stock_writes_nothing(app, make_user, make_product, fill_cart):
+    user_id = make_user()
+    plenty, short = make_product(stock=10), make_product(stock=1)
+    fill_cart(user_id, {plenty: 2, short: 2})
+
+    response = login(app.test_client(), user_id).post('/checkout')
+
+    assert response.status_code == 302
+    assert sold_and_stock(app, plenty) == (0, 10)
+    assert sold_and_stock(app, short) == (0, 1)
+    with app.app_context():
+        assert CartItem.query.filter_by(user_id=user_id).count() == 2
+        assert Order.query.filter_by(user_id=user_id).count() == 0
+
+
+def test_concurrent_checkouts_never_oversell(app, make_user, make_product, fill_cart):
+    stock, buyers = 25, 30
+    product_id = make_product(stock=stock)
+    # A second product every buyer also orders, so each reservation updates several rows
+    other_id = make_product(stock=1000)
+    clients = []
+    for _ in range(buyers):
+        user_id = make_user()
+        fill_cart(user_id, {product_id: 1, other_id: 1})
+        clients.append(login(app.test_client(), user_id))
+
+    start = threading.Barrier(buyers)
+    statuses = []
+
+    def checkout(client):
+        start.wait()
+        statuses.append(client.post('/checkout').status_code)
+
+    threads = [threading.Thread(target=checkout, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sold, remaining = sold_and_stock(app, product_id)
+    assert len(statuses) == buyers
+    assert remaining >= 0
+    assert sold <= stock
+    assert sold + remaining == stock
+    assert sold > 0
+    # Orders are all or nothing: the other product sold exactly as often
+    assert sold_and_stock(app, other_id) == (sold, 1000 - sold)
@@ -0,0 +1,75 @@
+from app import db
+from models import Pet
+from conftest import login
+
+
+def add_pets(app, owner_id, count):
+    with app.app_context():
+        pets = [Pet(name=f'Watermark {number}', species='dog', description='Friendly',
+                    user_id=owner_id) for number in range(count)]
+        db.session.add_all(pets)
+        db.session.commit()
+        return [pet.id for pet in pets]
+
+
+def revalidate(client, url, etag):
+    return client.get(url, headers={'If-None-Match': etag})
+
+
+def test_listing_revalidates_until_pets_change(app, make_user):
+    owner_id = make_user()
+    first, last = add_pets(app, owner_id, 2)
+    client = app.test_client()
+    etag = client.get('/pets').headers['ETag']
+
+    assert revalidate(client, '/pets', etag).status_code == 304
+
+    with app.app_context():
+        db.session.get(Pet, last).adoption_status = 'pending'
+        db.session.commit()
+    response = revalidate(client, '/pets', etag)
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+
+    # Deleting an older pet leaves the latest updated_at alone; the delete count still moves
+    with app.app_context():
+        db.session.delete(db.session.get(Pet, first))
+        db.session.commit()
+    assert revalidate(client, '/pets', etag).status_code == 200
+
+
+def test_pet_detail_sees_owners_other_pets_change(app, make_user):
+    owner_id = make_user()
+    shown, other = add_pets(app, owner_id, 2)
+    client = app.test_client()
+    url = f'/pets/{shown}'
+    etag = client.get(url).headers['ETag']
+
+    assert revalidate(client, url, etag).status_code == 304
+
+    with app.app_context():
+        db.session.get(Pet, other).adoption_status = 'adopted'
+        db.session.commit()
+    assert revalidate(client, url, etag).status_code == 200
+
+
+def test_if_modified_since_alone_never_gets_a_304(app, make_user):
+    add_pets(app, make_user(), 1)
+    client = app.test_client()
+    response = client.get('/pets')
+    assert 'Last-Modified' not in response.headers
+
+    later = 'Wed, 01 Jan 2100 00:00:00 GMT'
+    assert client.get('/pets', headers={'If-Modified-Since': later}).status_code == 200
+
+
+def test_owners_pet_page_is_never_revalidated(app, make_user):
+    owner_id = make_user()
+    [pet_id] = add_pets(app, owner_id, 1)
+    url = f'/pets/{pet_id}'
+    etag = app.test_client().get(url).headers['ETag']
+
+    # The owner's copy carries a CSRF token for the delete form
+    response = revalidate(login(app.test_client(), owner_id), url, etag)
+    assert response.status_code == 200
+    assert 'ETag' not in response.headers
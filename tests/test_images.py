@@ -0,0 +1,75 @@
+import io
+import os
+
+from PIL import Image
+from werkzeug.datastructures import FileStorage
+
+import images
+from app import db
+from images import process_pet_image, pet_image_url, rendition_filename
+from models import Pet
+from storage import store_upload, release_upload, remove_files
+
+
+def test_job_for_a_deleted_pet_does_nothing(app):
+    with app.app_context():
+        assert process_pet_image(pet_id=10 ** 9, image_filename='blobs/aa/bb/gone.jpg') is None
+
+
+def test_job_for_a_missing_photo_does_nothing(app, make_user):
+    with app.app_context():
+        pet = Pet(name='No photo', species='cat', description='Shy', image_filename='blobs/aa/bb/missing.jpg',
+                  user_id=make_user())
+        db.session.add(pet)
+        db.session.commit()
+        assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], pet.image_filename))
+
+        assert process_pet_image(pet_id=pet.id, image_filename=pet.image_filename) is None
+        assert db.session.get(Pet, pet.id).image_variants is None
+
+
+def processed_pet(app, owner_id):
+    photo = io.BytesIO()
+    Image.new('RGB', (300, 200), (200, 120, 40)).save(photo, 'PNG')
+    with app.app_context():
+        pet = Pet(name='Photogenic', species='dog', description='Poses', user_id=owner_id,
+                  image_filename=store_upload(FileStorage(io.BytesIO(photo.getvalue()), filename='photo.png')))
+        db.session.add(pet)
+        db.session.commit()
+        process_pet_image(pet_id=pet.id, image_filename=pet.image_filename)
+        return pet.id
+
+
+def stored(app, filename):
+    return os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+
+def test_new_rendition_settings_get_new_urls(app, make_user, monkeypatch):
+    pet_id = processed_pet(app, make_user())
+    with app.test_request_context():
+        pet = db.session.get(Pet, pet_id)
+        old_card = rendition_filename(pet.image_filename, 'card')
+        assert pet_image_url(pet, 'card').endswith(old_card)
+        assert stored(app, old_card)
+
+        # A cached copy of the old card must not be served for the new settings
+        monkeypatch.setitem(images.RENDITIONS, 'card', (800, 550, True))
+        monkeypatch.setitem(images.RENDITION_VERSIONS, 'card', f"card-{images._rendition_version('card')}")
+        new_card = rendition_filename(pet.image_filename, 'card')
+        assert new_card != old_card
+        # Until the photo is processed again the original is shown
+        assert pet_image_url(pet, 'card').endswith(f'uploads/{pet.image_filename}')
+
+        process_pet_image(pet_id=pet_id, image_filename=pet.image_filename)
+        pet = db.session.get(Pet, pet_id)
+        assert pet_image_url(pet, 'card').endswith(new_card)
+        with Image.open(os.path.join(app.config['UPLOAD_FOLDER'], new_card)) as card:
+            assert card.size == (800, 550)
+
+        # Releasing the photo removes the renditions made with either settings
+        image_filename = pet.image_filename
+        db.session.delete(pet)
+        released = release_upload(image_filename)
+        db.session.commit()
+        remove_files(released)
+    assert not stored(app, old_card) and not stored(app, new_card)
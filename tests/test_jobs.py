@@ -0,0 +1,38 @@
+import threading
+from datetime import datetime, timedelta
+
+import jobs
+from app import db
+from models import Job
+
+
+def test_running_workers_requeue_a_crashed_workers_job(app, monkeypatch):
+    ran = threading.Event()
+    monkeypatch.setitem(jobs.TASKS, 'test-stale', lambda: ran.set())
+    monkeypatch.setattr(jobs, '_next_stale_check', 0.0)
+    with app.app_context():
+        # Claimed by a worker process that died an hour ago
+        locked_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.add(Job(name='test-stale', status='running', attempts=1, locked_at=locked_at))
+        db.session.commit()
+
+    stop = threading.Event()
+    worker = threading.Thread(target=jobs._work, args=(stop,))
+    worker.start()
+    try:
+        assert ran.wait(10)
+    finally:
+        stop.set()
+        jobs._wakeup.set()
+        worker.join()
+
+
+def test_stale_jobs_are_looked_for_every_half_timeout(app, monkeypatch):
+    monkeypatch.setattr(jobs, '_next_stale_check', 0.0)
+    monkeypatch.setattr(jobs.time, 'monotonic', lambda: 1000.0)
+    monkeypatch.setitem(app.config, 'JOB_TIMEOUT', 600)
+    assert jobs._stale_check_due()
+    assert not jobs._stale_check_due()
+
+    monkeypatch.setattr(jobs.time, 'monotonic', lambda: 1300.0)
+    assert jobs._stale_check_due()
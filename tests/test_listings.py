@@ -0,0 +1,25 @@
+import pytest
+
+from conftest import count_statements
+
+
+def counts(statements):
+    return [statement for statement in statements if 'count(' in statement.lower()]
+
+
+@pytest.mark.parametrize('url', ['/pets', '/pets?species=dog'])
+def test_pet_browsing_runs_no_count(app, url):
+    client = app.test_client()
+    with count_statements(app) as statements:
+        response = client.get(url)
+    assert response.status_code == 200
+    assert not counts(statements), '\n'.join(statements)
+
+
+def test_numbered_pet_pages_still_count(app):
+    # Offset pagination for ?page= links shows page numbers, which need the total
+    client = app.test_client()
+    with count_statements(app) as statements:
+        response = client.get('/pets?page=1')
+    assert response.status_code == 200
+    assert counts(statements)
@@ -0,0 +1,36 @@
+import routes
+from app import db
+from models import Pet
+from conftest import login, count_statements
+
+
+def batch(client, profiles, limit=10):
+    return client.post('/api/pet-match/batch', json={'profiles': profiles, 'limit': limit})
+
+
+def test_anonymous_batches_are_capped(app, make_user):
+    profiles = [{'id': number, 'species': 'dog'} for number in range(routes.MAX_ANONYMOUS_BATCH_MATCH_PROFILES + 1)]
+
+    assert batch(app.test_client(), profiles).status_code == 400
+    assert batch(login(app.test_client(), make_user()), profiles).status_code == 200
+
+
+def test_matched_pets_are_loaded_in_chunks(app, make_user, monkeypatch):
+    owner_id = make_user()
+    with app.app_context():
+        db.session.add_all(Pet(name=f'Batch {number}', species='dog', age=30, size='medium', user_id=owner_id)
+                           for number in range(6))
+        db.session.commit()
+    profiles = [{'id': 1, 'species': 'dog'}, {'id': 2, 'species': 'dog', 'age_preference': 'adult'}]
+    client = app.test_client()
+    whole = batch(client, profiles).get_json()
+
+    monkeypatch.setattr(routes, 'ID_LOOKUP_CHUNK', 2)
+    with count_statements(app) as statements:
+        chunked = batch(client, profiles).get_json()
+
+    assert chunked == whole
+    assert sum(result['count'] for result in whole['results']) >= 6
+    lookups = [statement for statement in statements if 'FROM pet' in statement and ' IN (' in statement]
+    assert len(lookups) > 1
+    assert all(statement.count('?') <= 2 for statement in lookups)
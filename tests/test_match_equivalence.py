@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+from match_checks import Mismatch, check_scores, check_ranking, check_derived, engine_scores
+
+# Fixed, so a failure reproduces on every run; the CLI explores other seeds
+SEED = 20240611
+CASES = 150
+PETS = 40
+
+
+@pytest.fixture
+def rng():
+    return random.Random(SEED)
+
+
+def test_engine_scores_match_reference(rng):
+    assert check_scores(rng, engine_scores, CASES, PETS) == CASES + 1
+
+
+def test_engine_ranking_matches_reference(rng):
+    assert check_ranking(rng, CASES, PETS) == CASES
+
+
+def test_derived_attributes_match_reference(rng):
+    assert check_derived(rng, CASES) > CASES
+
+
+def test_a_wrong_scorer_is_caught(rng):
+    def off_by_one(rows, profiles):
+        return [[min(score + 1, 100) for score in scores] for scores in engine_scores(rows, profiles)]
+
+    with pytest.raises(Mismatch, match='preferences'):
+        check_scores(rng, off_by_one, CASES, PETS)
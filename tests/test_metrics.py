@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+import metrics
+from app import db
+
+STATS_URLS = ['/api/job-stats', '/api/fragment-cache-stats', '/api/pet-match/cache-stats']
+
+
+@pytest.mark.parametrize('url', STATS_URLS)
+def test_stats_need_the_metrics_token(app, monkeypatch, url):
+    client = app.test_client()
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', None)
+    assert client.get(url).status_code == 404
+    assert client.get(url, headers={'Authorization': 'Bearer '}).status_code == 404
+
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret-token')
+    assert client.get(url).status_code == 404
+    assert client.get(url, headers={'Authorization': 'Bearer s3cret-tök'}).status_code == 404
+    assert client.get(url, headers={'Authorization': 'Bearer s3cret-token'}).status_code == 200
+
+
+def test_metrics_need_the_token_and_the_flag(app, monkeypatch):
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer s3cret-token'}
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 's3cret-token')
+    monkeypatch.setitem(app.config, 'METRICS_ENABLED', False)
+    assert client.get('/metrics', headers=headers).status_code == 404
+
+    monkeypatch.setitem(app.config, 'METRICS_ENABLED', True)
+    assert client.get('/metrics').status_code == 404
+    assert client.get('/metrics', headers=headers).status_code == 200
+
+
+@pytest.fixture
+def timed_engine(app):
+    # The listeners metrics.py adds when METRICS_ENABLED is set at startup
+    with app.app_context():
+        engine = db.engine
+    listeners = [('before_cursor_execute', metrics._before_cursor_execute),
+                 ('after_cursor_execute', metrics._after_cursor_execute),
+                 ('handle_error', metrics._handle_error)]
+    for name, listener in listeners:
+        event.listen(engine, name, listener)
+    yield engine
+    for name, listener in listeners:
+        event.remove(engine, name, listener)
+
+
+def test_failed_statements_leave_no_timing_behind(app, timed_engine):
+    with app.test_request_context('/'):
+        metrics._start_request()
+        with timed_engine.connect() as connection:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    connection.execute(text('SELECT * FROM no_such_table'))
+            connection.execute(text('SELECT 1'))
+            assert not connection.info.get('metrics_started')
@@ -0,0 +1,37 @@
+import pagination
+from app import db
+from models import Product
+from pagination import cached_count
+
+
+def test_count_cache_is_bounded(app, monkeypatch):
+    monkeypatch.setattr(pagination, 'COUNT_CACHE_SIZE', 5)
+    monkeypatch.setattr(pagination, '_counts', pagination.OrderedDict())
+    with app.app_context():
+        for number in range(50):
+            cached_count(('products', f'category {number}'), Product.query.filter_by(category=f'{number}'))
+    assert len(pagination._counts) == 5
+    assert ('products', 'category 49') in pagination._counts
+
+
+def test_expired_counts_are_dropped_first(app, monkeypatch):
+    monkeypatch.setattr(pagination, 'COUNT_CACHE_SIZE', 2)
+    monkeypatch.setattr(pagination, '_counts', pagination.OrderedDict())
+    with app.app_context():
+        cached_count('kept', Product.query)
+        pagination._counts['stale'] = (0, 1)  # long expired
+        cached_count('new', Product.query)
+    assert list(pagination._counts) == ['kept', 'new']
+
+
+def test_unknown_categories_are_not_cached(app, monkeypatch):
+    with app.app_context():
+        db.session.add(Product(name='Counted', category='Counted Things', description='In stock', price=1.0,
+                               stock=1))
+        db.session.commit()
+    monkeypatch.setattr(pagination, '_counts', pagination.OrderedDict())
+    client = app.test_client()
+    for number in range(20):
+        assert client.get(f'/products?category=made-up-{number}').status_code == 200
+    assert client.get('/products?category=Counted Things').status_code == 200
+    assert list(pagination._counts) == [('products', 'Counted Things')]
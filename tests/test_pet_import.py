@@ -0,0 +1,108 @@
+import io
+import json
+
+import pytest
+
+from app import db
+from models import Pet
+from pet_import import import_pets, read_json_array, UnreadableRow
+
+
+def pet(number):
+    return {'name': f'Import {number}', 'species': 'dog', 'breed': 'Beagle', 'age': number % 200,
+            'gender': 'female'}
+
+
+def imported_pets(app, owner_id):
+    with app.app_context():
+        return Pet.query.filter_by(user_id=owner_id).count()
+
+
+def test_malformed_ndjson_line_is_rejected_and_import_continues(app, make_user):
+    owner_id = make_user()
+    lines = [json.dumps(pet(number)) for number in range(1000)]
+    lines.insert(500, '{"name": "Broken", "species": ')
+    rejects = []
+
+    with app.app_context():
+        imported, rejected = import_pets(io.StringIO('\n'.join(lines) + '\n'), 'ndjson', batch_size=100,
+                                         owner_id=owner_id, on_reject=lambda *reject: rejects.append(reject))
+
+    assert (imported, rejected) == (1000, 1)
+    assert imported_pets(app, owner_id) == 1000
+    [(number, data, error)] = rejects
+    assert number == 501
+    assert data == lines[500].strip()
+    assert error.startswith('Line 501: invalid JSON')
+
+
+def test_invalid_rows_are_rejected(app, make_user):
+    owner_id = make_user()
+    rows = [pet(1), {'name': 'No species'}, pet(2), ['not', 'an', 'object'], pet(3)]
+    rejects = []
+
+    with app.app_context():
+        imported, rejected = import_pets(io.StringIO(json.dumps(rows)), 'json', owner_id=owner_id,
+                                         on_reject=lambda *reject: rejects.append(reject))
+
+    assert (imported, rejected) == (3, 2)
+    assert [number for number, _, _ in rejects] == [2, 4]
+
+
+def test_rows_before_a_broken_feed_are_kept(app, make_user):
+    owner_id = make_user()
+    truncated = json.dumps([pet(number) for number in range(250)])[:-1]
+
+    with app.app_context():
+        with pytest.raises(ValueError):
+            import_pets(io.StringIO(truncated), 'json', batch_size=100, owner_id=owner_id)
+        db.session.rollback()
+
+    assert imported_pets(app, owner_id) == 250
+
+
+def test_malformed_array_element_is_rejected_and_import_continues(app, make_user):
+    owner_id = make_user()
+    elements = [json.dumps(pet(number)) for number in range(1000)]
+    elements.insert(500, '{"name": "Broken, really]", "tags": [1, {"a": 2}], "species": oops}')
+    rejects = []
+
+    with app.app_context():
+        imported, rejected = import_pets(io.StringIO('[' + ',\n'.join(elements) + ']'), 'json', batch_size=100,
+                                         owner_id=owner_id, on_reject=lambda *reject: rejects.append(reject))
+
+    assert (imported, rejected) == (1000, 1)
+    assert imported_pets(app, owner_id) == 1000
+    [(number, data, error)] = rejects
+    assert number == 501
+    assert data == elements[500]
+    assert error.startswith('Element 501: invalid JSON')
+
+
+def test_array_elements_split_across_chunks(app):
+    elements = ['{"name": "a\\"b,]}", "n": [1, 2]}', '{"bad": [1, "x,]" tru]}', '{"name": "c"}', '{bad}']
+    text = '[ ' + ' , '.join(elements) + ' ]'
+
+    for chunk_size in (1, 3, 7, len(text)):
+        rows = list(read_json_array(io.StringIO(text), chunk_size=chunk_size))
+        assert rows[0] == {'name': 'a"b,]}', 'n': [1, 2]}
+        assert isinstance(rows[1], UnreadableRow) and rows[1].data == elements[1]
+        assert rows[2] == {'name': 'c'}
+        assert isinstance(rows[3], UnreadableRow) and rows[3].data == '{bad}'
+        assert len(rows) == 4
+
+
+def test_malformed_element_is_reported_without_reading_ahead(app):
+    class CountingStream(io.StringIO):
+        reads = 0
+
+        def read(self, size=-1):
+            CountingStream.reads += 1
+            return super().read(size)
+
+    body = ',\n'.join(json.dumps(pet(number)) for number in range(5000))
+    stream = CountingStream('[{"name": nope},\n' + body + ']')
+    rows = read_json_array(stream, chunk_size=1024)
+
+    assert isinstance(next(rows), UnreadableRow)
+    assert CountingStream.reads <= 2
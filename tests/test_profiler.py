@@ -0,0 +1,24 @@
+import pytest
+
+from sampling_profiler import PROFILE_HEADER, _wants_profile
+
+
+@pytest.mark.parametrize('header, wanted', [
+    ('s3cret-token', True),
+    ('s3cret-tokeN', False),
+    ('s3cret', False),
+    ('', False),
+    (None, False),
+    ('s3cret-tök', False),
+])
+def test_profile_header_must_match_the_token(app, monkeypatch, header, wanted):
+    monkeypatch.setitem(app.config, 'PROFILE_TOKEN', 's3cret-token')
+    headers = {PROFILE_HEADER: header} if header is not None else {}
+    with app.test_request_context('/', headers=headers):
+        assert _wants_profile() is wanted
+
+
+def test_profiling_is_off_without_a_token(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROFILE_TOKEN', None)
+    with app.test_request_context('/', headers={PROFILE_HEADER: ''}):
+        assert _wants_profile() is False
@@ -0,0 +1,66 @@
+import pytest
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import joinedload
+
+from app import db
+from models import Pet, Product, Donation, CartItem
+from conditional import watermark_query
+
+
+# (name, query builder, table, index the plan must search)
+HOT_QUERIES = [
+    ('featured pets', lambda: Pet.query.filter_by(adoption_status='available')
+        .order_by(Pet.created_at.desc()).limit(4),
+     'pet', 'ix_pet_status_created'),
+    ('pet listing', lambda: Pet.query.filter_by(adoption_status='available')
+        .order_by(Pet.created_at.desc(), Pet.id.desc()).limit(13),
+     'pet', 'ix_pet_status_created'),
+    ('pet listing by species', lambda: Pet.query.filter_by(adoption_status='available')
+        .filter(Pet.species == 'dog').order_by(Pet.created_at.desc(), Pet.id.desc()).limit(13),
+     'pet', 'ix_pet_status_species_created'),
+    ('owner\'s other pets', lambda: Pet.query.filter(Pet.user_id == 1, Pet.id != 2,
+                                                     Pet.adoption_status == 'available').limit(4),
+     'pet', 'ix_pet_user_status'),
+    # Either user_id-led index serves this one
+    ('profile pets', lambda: Pet.query.filter_by(user_id=1),
+     'pet', 'ix_pet_user_'),
+    ('cart items', lambda: CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=1)
+        .order_by(CartItem.id),
+     'cart_item', 'ix_cart_item_user_product'),
+    ('cart count', lambda: select(func.coalesce(func.sum(CartItem.quantity), 0)).where(CartItem.user_id == 1),
+     'cart_item', 'ix_cart_item_user_product'),
+    ('recent public donations', lambda: Donation.query.filter_by(is_anonymous=False)
+        .order_by(Donation.donation_date.desc()).limit(3),
+     'donation', 'ix_donation_anonymous_date'),
+    ('profile donations', lambda: Donation.query.filter_by(user_id=1).order_by(Donation.donation_date.desc()),
+     'donation', 'ix_donation_user_date'),
+    ('products by category', lambda: Product.query.filter_by(category='Toys').order_by(Product.id).limit(13),
+     'product', 'ix_product_category'),
+    ('related products', lambda: Product.query.filter(Product.category == 'Toys', Product.id != 1).limit(4),
+     'product', 'ix_product_category'),
+    ('pet watermark', lambda: watermark_query(Pet),
+     'pet', 'ix_pet_updated'),
+    ('owner\'s pets watermark', lambda: watermark_query(Pet, Pet.user_id == 1),
+     'pet', 'ix_pet_user_updated'),
+    ('product watermark', lambda: watermark_query(Product),
+     'product', 'ix_product_updated'),
+    ('deletes watermark', lambda: watermark_query(Pet),
+     'table_version', 'sqlite_autoindex_table_version_1'),
+]
+
+
+def query_plan(query):
+    statement = getattr(query, 'statement', query)
+    sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    # (id, parent, notused, detail)
+    return [row[-1] for row in db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'))]
+
+
+@pytest.mark.parametrize('name, build, table, index', HOT_QUERIES, ids=[case[0] for case in HOT_QUERIES])
+def test_hot_query_searches_index(app, name, build, table, index):
+    with app.app_context():
+        plan = query_plan(build())
+    lines = [line for line in plan if line.split()[1:2] == [table]]
+    assert lines, plan
+    assert all(line.startswith('SEARCH') for line in lines), plan
+    assert any(index in line for line in lines), plan
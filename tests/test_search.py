@@ -0,0 +1,31 @@
+import pytest
+
+import search
+from app import db
+from models import Pet
+from search import filter_pets_by_text
+
+
+@pytest.fixture
+def searchable(app, make_user):
+    with app.app_context():
+        pet = Pet(name='Biscuit', species='dog', breed='Beagle', description='Loves long walks',
+                  user_id=make_user())
+        db.session.add(pet)
+        db.session.commit()
+        return pet.id
+
+
+@pytest.mark.parametrize('backend', ['fts5', 'like'])
+def test_text_without_terms_matches_nothing(app, searchable, monkeypatch, backend):
+    monkeypatch.setattr(search, '_backend', backend)
+    with app.app_context():
+        assert searchable in [pet.id for pet in filter_pets_by_text(Pet.query, 'biscuit')]
+        for query_text in ['!!', ' - ', '%']:
+            assert filter_pets_by_text(Pet.query, query_text).count() == 0
+
+
+def test_punctuation_search_lists_no_pets(app, searchable):
+    response = app.test_client().get('/pets?query=!!')
+    assert response.status_code == 200
+    assert b'Biscuit' not in response.data
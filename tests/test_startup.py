@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import text
+
+from app import db
+from models import check_schema
+from conftest import ROOT
+
+
+@pytest.mark.parametrize('module', ['routes', 'cart', 'matching', 'jobs', 'storage', 'images',
+                                    'applicants', 'models', 'metrics', 'pet_import', 'wsgi'])
+def test_any_module_can_be_imported_first(module, tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'empty.db'}")
+    result = subprocess.run([sys.executable, '-c', f'import {module}'], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+
+def test_schema_check_passes_once_initialised(app):
+    with app.app_context():
+        check_schema()
+
+
+def test_schema_check_refuses_an_old_database(tmp_path):
+    old = Flask(__name__)
+    old.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'old.db'}"
+    db.init_app(old)
+    with old.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('CREATE TABLE pet (id INTEGER PRIMARY KEY, name VARCHAR(100))'))
+        with pytest.raises(RuntimeError, match=r'pet\.species.*flask init-db'):
+            check_schema()
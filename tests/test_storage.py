@@ -0,0 +1,188 @@
+import io
+import os
+import threading
+
+from sqlalchemy import delete, insert
+from werkzeug.datastructures import FileStorage
+
+import storage
+from app import db
+from models import Pet, UploadBlob
+from storage import store_upload, release_upload, remove_files, blob_filename
+from conftest import login
+
+
+def upload(data, name='photo.jpg'):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def blob_row(app, filename):
+    with app.app_context():
+        blob = UploadBlob.query.filter_by(filename=filename).one_or_none()
+        return blob and (blob.digest, blob.refcount)
+
+
+def stored(app, filename):
+    return os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+
+
+def test_identical_uploads_are_stored_once(app):
+    data = os.urandom(1000)
+    with app.app_context():
+        filenames = {store_upload(upload(data)) for _ in range(3)}
+        db.session.commit()
+
+    [filename] = filenames
+    assert blob_row(app, filename)[1] == 3
+    assert stored(app, filename)
+
+
+def test_concurrent_uploads_of_a_new_file(app):
+    data, uploads = os.urandom(1000), 8
+    start = threading.Barrier(uploads)
+    filenames, errors = [], []
+
+    def store():
+        with app.app_context():
+            start.wait()
+            try:
+                filenames.append(store_upload(upload(data)))
+                db.session.commit()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=store) for _ in range(uploads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    [filename] = set(filenames)
+    assert blob_row(app, filename)[1] == uploads
+
+
+def test_losing_the_insert_race_takes_a_reference_instead(app, monkeypatch):
+    data = os.urandom(1000)
+    winner = None
+    add_reference = storage._add_reference
+
+    def digest_inserted_after_update(digest):
+        # Another upload's row, there by the time this one inserts but missed by its UPDATE
+        nonlocal winner
+        found = add_reference(digest)
+        if winner is None:
+            winner = blob_filename(digest, '.png')
+            db.session.execute(insert(UploadBlob).values(digest=digest, filename=winner, refcount=1))
+        return found
+
+    monkeypatch.setattr(storage, '_add_reference', digest_inserted_after_update)
+    with app.app_context():
+        filename = store_upload(upload(data, 'photo.jpg'))
+        db.session.commit()
+
+    assert filename == winner
+    assert blob_row(app, winner)[1] == 2
+    # The copy stored under this upload's own extension is not kept
+    assert not stored(app, blob_filename(blob_row(app, winner)[0], '.jpg'))
+
+
+def test_upload_restores_a_file_released_just_before(app, monkeypatch):
+    data = os.urandom(1000)
+    with app.app_context():
+        filename = store_upload(upload(data))
+        db.session.commit()
+    take_reference = storage._take_reference
+
+    def released_meanwhile(*args):
+        # The last reference is released and its file removed while this upload runs
+        with db.engine.begin() as connection:
+            connection.execute(delete(UploadBlob).where(UploadBlob.filename == filename))
+        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        return take_reference(*args)
+
+    monkeypatch.setattr(storage, '_take_reference', released_meanwhile)
+    with app.app_context():
+        assert store_upload(upload(data)) == filename
+        db.session.commit()
+
+    assert blob_row(app, filename)[1] == 1
+    assert stored(app, filename)
+
+
+def test_release_keeps_a_blob_that_is_still_referenced(app):
+    data = os.urandom(1000)
+    with app.app_context():
+        filename = store_upload(upload(data))
+        store_upload(upload(data))
+        db.session.commit()
+
+        assert release_upload(filename) == []
+        db.session.commit()
+        assert blob_row(app, filename)[1] == 1
+
+        assert release_upload(filename) == [filename]
+        db.session.commit()
+    assert blob_row(app, filename) is None
+
+
+def test_released_file_uploaded_again_is_not_removed(app):
+    data = os.urandom(1000)
+    with app.app_context():
+        filename = store_upload(upload(data))
+        db.session.commit()
+        released = release_upload(filename)
+        db.session.commit()
+        # Uploaded again before the released file was cleaned up
+        store_upload(upload(data))
+        db.session.commit()
+        remove_files(released)
+
+    assert stored(app, filename)
+
+
+def test_new_blob_is_rolled_back_with_its_record(app):
+    with app.app_context():
+        filename = store_upload(upload(os.urandom(1000)))
+        db.session.rollback()
+
+    assert blob_row(app, filename) is None
+
+
+def test_deleting_a_pet_releases_its_photo(app, make_user):
+    owner_id = make_user()
+    data = os.urandom(1000)
+    with app.app_context():
+        pets = [Pet(name=f'Photo {number}', species='cat', image_filename=store_upload(upload(data)),
+                    user_id=owner_id) for number in range(2)]
+        db.session.add_all(pets)
+        db.session.commit()
+        first, second = (pet.id for pet in pets)
+        filename = pets[0].image_filename
+    client = login(app.test_client(), owner_id)
+
+    # The other pet still uses the photo
+    assert client.post(f'/pets/{first}/delete').status_code == 302
+    assert blob_row(app, filename)[1] == 1
+    assert stored(app, filename)
+
+    assert client.post(f'/pets/{second}/delete').status_code == 302
+    with app.app_context():
+        assert Pet.query.filter(Pet.id.in_([first, second])).count() == 0
+    assert blob_row(app, filename) is None
+    assert not stored(app, filename)
+
+
+def test_only_the_owner_can_delete_a_pet(app, make_user):
+    owner_id, other_id = make_user(), make_user()
+    with app.app_context():
+        pet = Pet(name='Kept', species='dog', user_id=owner_id)
+        db.session.add(pet)
+        db.session.commit()
+        pet_id = pet.id
+
+    assert b'Remove Listing' in login(app.test_client(), owner_id).get(f'/pets/{pet_id}').data
+    assert b'Remove Listing' not in login(app.test_client(), other_id).get(f'/pets/{pet_id}').data
+    assert login(app.test_client(), other_id).post(f'/pets/{pet_id}/delete').status_code == 403
+    with app.app_context():
+        assert db.session.get(Pet, pet_id) is not None
@@ -0,0 +1,11 @@
+# The complete application: the app from app.py with every module that registers
+# views, request hooks or CLI commands on it. The `flask` command finds this file
+# before app.py, and main.py (`gunicorn main:app`) serves it.
+from app import app
+import metrics  # first, so its request hooks wrap everyone else's
+import query_profiler
+import sampling_profiler
+import models
+import routes
+import search
+import pet_import